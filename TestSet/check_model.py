@@ -1,8 +1,10 @@
 import os
+import sys
 import cv2
 import joblib  # For loading the model
-import numpy as np
-from image_processing_pipeline import process_image  # For image processing and face keypoint extraction
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from data_processing_method.image_processing_pipeline import process_image  # For image processing and face keypoint extraction
 
 # Load random forest model
 def load_rf_model(model_path):
@@ -16,12 +18,12 @@ def load_rf_model(model_path):
 
 # Predict expression using the model
 def predict_expression(model, faces):
-    if not faces:
+    if faces is None or len(faces) == 0:
         print("No face keypoints detected")
         return None
 
-    # Flatten face keypoints into a 1D array, matching the input format expected by the model
-    flat_keypoints = np.array([coord for face in faces for point in face for coord in point]).reshape(1, -1)
+    # Flatten the (n_faces, 468, 2) keypoint array into one row, matching the input format expected by the model
+    flat_keypoints = faces.reshape(1, -1)
 
     # Predict expression using the model
     prediction = model.predict(flat_keypoints)
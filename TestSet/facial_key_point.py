@@ -1,40 +1,10 @@
+import os
+import sys
 import cv2
-import mediapipe as mp
 import time
-class FaceMeshDetector():
-    def __init__(self, staticMode=False, maxFace=2, minDetectionCon=0.5, minTrackCon=0.5):
-        self.staticMode = staticMode
-        self.maxFace = maxFace
-        self.minDetectionCon = minDetectionCon
-        self.minTrackCon = minTrackCon
-        self.mpDraw = mp.solutions.drawing_utils
-        self.mpFaceMesh = mp.solutions.face_mesh
-        self.faceMesh = self.mpFaceMesh.FaceMesh(
-            static_image_mode=self.staticMode,
-            max_num_faces=self.maxFace,
-            min_detection_confidence=self.minDetectionCon,
-            min_tracking_confidence=self.minTrackCon
-        )
-        self.drawSpec = self.mpDraw.DrawingSpec(thickness=1, circle_radius=2)
-    def find_face_mesh(self, img, draw=True):
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = self.faceMesh.process(imgRGB)
-        faces = []
-        if results.multi_face_landmarks:
-            for faceLms in results.multi_face_landmarks:
-                if draw:
-                    self.mpDraw.draw_landmarks(img, faceLms, self.mpFaceMesh.FACEMESH_TESSELATION,
-                                               self.drawSpec, self.drawSpec)
-                face = []
-                for id, lm in enumerate(faceLms.landmark):
-                    ih, iw, ic = img.shape
-                    x, y = int(lm.x * iw), int(lm.y * ih)
-                    # cv2.putText(img, str(id), (x, y), cv2.FONT_HERSHEY_PLAIN,
-                    #             0.5, (0, 255, 0), 1)
-                    #print(id, x, y)
-                    face.append([x, y])
-                faces.append(face)
-        return img, faces
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from data_processing_method.face_mesh_module import FaceMeshDetector
 def main():
     cap = cv2.VideoCapture("video1.mp4")
     p_time = 0
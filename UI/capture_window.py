@@ -1,22 +1,30 @@
+import os
+import sys
 import streamlit as st
 import cv2
-import time
 import numpy as np
 from streamlit_webrtc import webrtc_streamer, VideoTransformerBase
-from helper.face_detection import detect_faces, draw_face_boxes
-from helper.emotion_model import predict_emotion
-from helper.utils import convert_frame_to_image
-from helper.face_mesh import FaceMeshDetector
+
+# Make the repository root importable, the helpers share code with data_processing_method
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from UI.helper.face_detection import draw_face_boxes, draw_face_labels
+from UI.helper.face_mesh import FaceMeshDetector
+from UI.helper.face_tracking import FaceTracker, detect_with_mesh
+from UI.helper.prediction_scheduler import PredictionScheduler  # Same model as demo.py
 
 # Define the VideoTransformer class
 class VideoTransformer(VideoTransformerBase):
     def __init__(self):
         self.detector = FaceMeshDetector()
+        # Full-frame detection only every few frames, in between the faces are tracked
+        self.tracker = FaceTracker(lambda image: detect_with_mesh(self.detector, image))
+        # Predictions are reused while a face does not change and smoothed per track
+        self.scheduler = PredictionScheduler()
         self.show_face_mesh = True
         self.show_face_box = True
-        self.detection_interval = 1  # in seconds
         self.current_label = "No Face Detected"
-        self.last_detection_time = time.time()
+        self.current_labels = []  # One label per face box
 
     def transform(self, frame):
         img = frame.to_ndarray(format="bgr24")
@@ -24,26 +32,27 @@ class VideoTransformer(VideoTransformerBase):
         # Resize frame to 720x405
         img = cv2.resize(img, (720, 405))
 
-        # Detect face mesh
-        img, faces_mesh, face_detected = self.detector.find_face_mesh(img, draw=self.show_face_mesh)
+        # Track the faces, the boxes come from the mesh landmarks
+        tracks = self.tracker.update(img)
+        face_boxes = [track.box for track in tracks]
 
-        # Always run detection logic
-        face_boxes = detect_faces(img)
+        # Emotion prediction logic, the faces are cropped before anything is drawn
+        if face_boxes:
+            # Only the faces that changed since their last prediction go through the CNN, in one batch
+            predictions = self.scheduler.update(img, tracks)
+            self.current_labels = [f"#{track.track_id} {label}" for track, (label, _) in zip(tracks, predictions)]
+            self.current_label = ", ".join(self.current_labels)
+        else:
+            self.current_label = "No Face Detected"
+            self.current_labels = []
 
-        # If needed, draw face boxes
+        # If needed, draw face mesh and face boxes
+        if self.show_face_mesh:
+            self.detector.draw_face_mesh(img, [track.landmarks for track in tracks if track.landmarks is not None])
         if self.show_face_box:
             draw_face_boxes(img, face_boxes)
-
-        # Emotion prediction logic
-        if face_detected and face_boxes:
-            current_time = time.time()
-            if current_time - self.last_detection_time >= self.detection_interval:
-                x, y, x_end, y_end = face_boxes[0]  # Only process the first face
-                face_image = convert_frame_to_image(img, x, y, x_end, y_end)
-                self.current_label = predict_emotion(face_image)
-                self.last_detection_time = current_time
-        else:
-            self.current_label = "No Face Detected"
+        if face_boxes:
+            draw_face_labels(img, face_boxes, self.current_labels)
 
         # Display prediction result
         cv2.putText(img, f"Predicted: {self.current_label}", (10, 30),
@@ -1,34 +1,193 @@
 import os
-import torch
-import torch.nn as nn
-from torchvision import models, transforms
+import time
+import threading
+import numpy as np
 from PIL import Image
+from train.cnn_config import (LABELS, IMG_SIZE, ONNX_MODEL_PATHS, QUANTIZED_MODEL_PATHS, NORMALIZE_MEAN,
+                              NORMALIZE_STD, EXIT_THRESHOLD, QUANTIZATION_ENGINE)
 
-# 标签列表
-LABELS = ["angry", "disgust", "fear", "happy", "neutral", "sad", "surprise"]
+# 模型变体: 输入通道数和模型文件格式, 通过环境变量 FER_MODEL 选择 (默认 RGB 输入的 resnet18)
+MODEL_VARIANTS = {
+    "resnet18": {"in_channels": 3, "format": "fp32"},            # RGB 输入
+    "resnet18_gray": {"in_channels": 1, "format": "fp32"},       # 单通道灰度输入
+    "resnet18_int8": {"in_channels": 3, "format": "int8"},       # 静态 INT8 量化 (CPU)
+    "resnet18_gray_int8": {"in_channels": 1, "format": "int8"},
+    "resnet18_early_exit": {"in_channels": 3, "format": "early_exit"},  # 置信度足够时在中间层提前输出
+    "resnet18_gray_early_exit": {"in_channels": 1, "format": "early_exit"},
+    "student": {"in_channels": 3, "format": "student"},          # 蒸馏得到的小型 CNN, 适合实时演示
+    "student_gray": {"in_channels": 1, "format": "student"},
+    "resnet18_onnx": {"in_channels": 3, "format": "onnx"},       # onnxruntime CPU 推理, 不需要 torch
+    "resnet18_gray_onnx": {"in_channels": 1, "format": "onnx"},
+}
+MODEL_VARIANT = os.environ.get("FER_MODEL", "resnet18")
+# early exit 模型的置信度阈值, 越低越早输出 (更快, 准确率可能下降)
+EARLY_EXIT_THRESHOLD = float(os.environ.get("FER_EXIT_THRESHOLD", EXIT_THRESHOLD))
 
-# 获取当前脚本文件的目录，并构建到模型文件的相对路径
-model_path = os.path.join(os.path.dirname(__file__), "../../ml_model/cnn/cnn_model.pth")
+# 仓库根目录, 模型文件路径相对于它
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../..")
 
-# 加载模型并设置设备
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = models.resnet18(pretrained=False)
-model.fc = nn.Linear(model.fc.in_features, len(LABELS))
-model.load_state_dict(torch.load(model_path, map_location=device))
-model = model.to(device)
-model.eval()
 
-# 预处理图像的转换
-transform = transforms.Compose([
-    transforms.Resize((48, 48)),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-])
+def softmax(logits):
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class TorchBackend:
+    """PyTorch 推理: fp32 ResNet18 或蒸馏的小型 CNN (有 GPU 时使用 GPU), 或 INT8 量化的 TorchScript 模型 (仅 CPU)"""
+
+    def __init__(self, in_channels, model_format):
+        import torch
+        from train.cnn_model import load_cnn_model, load_early_exit_cnn, load_student_cnn, build_eval_transform
+
+        self.torch = torch
+        self.early_exit = model_format == "early_exit"
+        if model_format == "int8":
+            # 量化模型只能在 CPU 上运行, 保存为 TorchScript, 无需重建网络结构
+            torch.backends.quantized.engine = QUANTIZATION_ENGINE
+            self.device = torch.device("cpu")
+            self.model = torch.jit.load(os.path.join(ROOT_DIR, QUANTIZED_MODEL_PATHS[in_channels]), map_location="cpu")
+        elif self.early_exit:
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            self.model = load_early_exit_cnn(in_channels, self.device, ROOT_DIR)
+        elif model_format == "student":
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            self.model = load_student_cnn(in_channels, self.device, ROOT_DIR)
+        else:
+            # CPU 上直接加载冻结的 TorchScript 模型 (train/freeze_cnn_model.py 生成), 不存在时重建网络
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            self.model = load_cnn_model(in_channels, self.device, ROOT_DIR)
+        self.model.eval()
+        self.transform = build_eval_transform(in_channels)  # 灰度模型先转为单通道
+
+    def predict_probs(self, images):
+        batch = self.torch.stack([self.transform(image) for image in images]).to(self.device)
+        with self.torch.no_grad():
+            logits = self.model.predict(batch, EARLY_EXIT_THRESHOLD)[0] if self.early_exit else self.model(batch)
+            return self.torch.softmax(logits, dim=1).cpu().numpy()
+
+
+class OnnxBackend:
+    """
+    onnxruntime CPU 推理, 模型由 train/export_onnx_model.py 导出。
+    预处理用 PIL + numpy 实现 (与 build_eval_transform 结果一致), 整个推理过程不导入 torch
+    """
+
+    def __init__(self, in_channels, model_format):
+        import onnxruntime
+
+        self.in_channels = in_channels
+        model_path = os.path.join(ROOT_DIR, ONNX_MODEL_PATHS[in_channels])
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def preprocess(self, image):
+        if self.in_channels == 1:
+            image = image.convert("L")
+        # 与 transforms.Resize 相同的双线性缩放, 再归一化为 (C, H, W) float32
+        pixels = np.asarray(image.resize(IMG_SIZE, Image.BILINEAR), dtype=np.float32).reshape(
+            IMG_SIZE[1], IMG_SIZE[0], -1)
+        return ((pixels / 255 - NORMALIZE_MEAN) / NORMALIZE_STD).transpose(2, 0, 1)
+
+    def predict_probs(self, images):
+        batch = np.stack([self.preprocess(image) for image in images])
+        return softmax(self.session.run(None, {self.input_name: batch})[0])
+
+
+# 模型格式 -> 推理后端
+BACKENDS = {"fp32": TorchBackend, "int8": TorchBackend, "early_exit": TorchBackend, "student": TorchBackend,
+            "onnx": OnnxBackend}
+
+
+class EmotionModelManager:
+    """
+    进程内共享的情绪模型。
+    模型 (以及推理后端, 如 torch) 在第一次预测时才加载, 无论多少入口调用, 每个进程只加载一次;
+    也可以用 warmup() 在后台线程中提前加载。load_seconds 记录冷启动耗时。
+    """
+
+    def __init__(self, variant=MODEL_VARIANT):
+        if variant not in MODEL_VARIANTS:
+            raise ValueError(f"Unknown model variant {variant}, expected one of {list(MODEL_VARIANTS)}")
+        self.variant = variant
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._warmup_thread = None
+
+    @property
+    def is_loaded(self):
+        return self._loaded
+
+    def _load(self):
+        spec = MODEL_VARIANTS[self.variant]
+        self.backend = BACKENDS[spec["format"]](spec["in_channels"], spec["format"])
+        self.labels = LABELS
+
+    def load(self):
+        """加载模型 (已加载则直接返回)"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._load()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+                    print(f"Emotion model '{self.variant}' loaded in {self.load_seconds:.2f}s")
+        return self
+
+    def warmup(self):
+        """在后台线程中加载模型, 立即返回该线程; Streamlit 每次重新运行都会调用, 只有第一次启动线程"""
+        with self._lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(target=self.load, name="emotion-model-warmup", daemon=True)
+                self._warmup_thread.start()
+            return self._warmup_thread
+
+    def predict_batch(self, images):
+        """
+        一次前向传播预测多张PIL图像
+        :return: 标签列表, 各类别概率 (n, len(labels)) numpy 数组
+        """
+        if not images:
+            return [], None  # 没有人脸时不必加载模型
+        self.load()
+        # 灰度 / RGBA 图像 (如上传的 PNG) 先转为 RGB
+        probs = self.backend.predict_probs([image if image.mode == "RGB" else image.convert("RGB")
+                                            for image in images])
+        return [self.labels[i] for i in probs.argmax(axis=1)], probs
+
+    def predict(self, image):
+        labels, _ = self.predict_batch([image])
+        return labels[0]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_model_manager():
+    """进程内唯一的模型管理器"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = EmotionModelManager()
+    return _manager
+
+
+def warmup():
+    return get_model_manager().warmup()
+
 
 def predict_emotion(image):
     """对PIL图像进行情绪预测"""
-    image = transform(image).unsqueeze(0).to(device)
-    with torch.no_grad():
-        output = model(image)
-        _, predicted = torch.max(output, 1)
-        return LABELS[predicted.item()]
+    return get_model_manager().predict(image)
+
+
+def predict_emotions(crops):
+    """
+    对一帧中的所有人脸 (PIL图像列表) 做一次批量预测
+    :return: 每张人脸的 (标签, 各类别概率) 列表
+    """
+    labels, probs = get_model_manager().predict_batch(crops)
+    return list(zip(labels, probs)) if labels else []
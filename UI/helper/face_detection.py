@@ -1,10 +1,18 @@
 # UI/helper/face_detection.py
+import os
 import cv2
+import numpy as np
 
-face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+face_cascade = None  # Haar 只在 detect_faces 第一次被调用时加载
+
+# FaceMesh 没有找到人脸时是否再用 Haar 检测一次, 通过环境变量 FER_HAAR_FALLBACK=1 打开
+HAAR_FALLBACK = os.environ.get("FER_HAAR_FALLBACK", "0") == "1"
 
 def detect_faces(frame, padding=0.2):
     """检测图像中的人脸并返回每个正方形框的位置"""
+    global face_cascade
+    if face_cascade is None:
+        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
     
@@ -17,7 +25,46 @@ def detect_faces(frame, padding=0.2):
         face_boxes.append((x, y, x_end, y_end))
     return face_boxes
 
+def boxes_from_landmarks(faces, frame_shape, padding=0.2):
+    """
+    由 FaceMesh 关键点的范围直接计算正方形人脸框, 填充方式与 detect_faces 相同:
+    边长为 max(w, h) 加上两侧各 padding * max(w, h), 正方形以关键点范围的中心为中心
+    :param faces: (n_faces, 468, 2) 的关键点像素坐标
+    :return: [(x, y, x_end, y_end), ...]
+    """
+    if len(faces) == 0:
+        return []
+    mins = faces.min(axis=1).astype(np.int32)
+    maxs = faces.max(axis=1).astype(np.int32)
+    sides = (maxs - mins).max(axis=1)
+    pads = (padding * sides).astype(np.int32)
+    sizes = sides + 2 * pads
+    starts = (mins + maxs) // 2 - sizes[:, None] // 2
+    height, width = frame_shape[:2]
+    x = np.clip(starts[:, 0], 0, width)
+    y = np.clip(starts[:, 1], 0, height)
+    x_end = np.clip(starts[:, 0] + sizes, 0, width)
+    y_end = np.clip(starts[:, 1] + sizes, 0, height)
+    # 关键点可能全部落在画面外, 这样的框是空的
+    return [box for box in zip(x.tolist(), y.tolist(), x_end.tolist(), y_end.tolist())
+            if box[2] > box[0] and box[3] > box[1]]
+
+def locate_faces(frame, faces, padding=0.2, fallback=HAAR_FALLBACK):
+    """
+    每帧只付一次检测的代价: 有 FaceMesh 关键点时用它们计算人脸框,
+    只有 FaceMesh 没有找到人脸并且 fallback 为 True 时才运行 Haar 检测
+    """
+    boxes = boxes_from_landmarks(faces, frame.shape, padding)
+    if not boxes and fallback:
+        boxes = detect_faces(frame, padding)
+    return boxes
+
 def draw_face_boxes(frame, boxes):
     """在图像上绘制给定的方框"""
     for (x, y, x_end, y_end) in boxes:
         cv2.rectangle(frame, (x, y), (x_end, y_end), (255, 0, 0), 2)
+
+def draw_face_labels(frame, boxes, labels):
+    """在每个方框上方写出对应的标签"""
+    for (x, y, x_end, y_end), label in zip(boxes, labels):
+        cv2.putText(frame, label, (x, max(y - 10, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
@@ -1,43 +1,13 @@
-import cv2
-import mediapipe as mp
+from data_processing_method.face_mesh_module import FaceMeshDetector as _FaceMeshDetector
 
 
-class FaceMeshDetector:
-    def __init__(self, staticMode=False, maxFace=2, minDetectionCon=0.5, minTrackCon=0.5):
-        self.staticMode = staticMode
-        self.maxFace = maxFace
-        self.minDetectionCon = minDetectionCon
-        self.minTrackCon = minTrackCon
-
-        self.mpDraw = mp.solutions.drawing_utils
-        self.mpFaceMesh = mp.solutions.face_mesh
-        self.faceMesh = self.mpFaceMesh.FaceMesh(
-            static_image_mode=self.staticMode,
-            max_num_faces=self.maxFace,
-            min_detection_confidence=self.minDetectionCon,
-            min_tracking_confidence=self.minTrackCon
-        )
-        self.drawSpec = self.mpDraw.DrawingSpec(thickness=1, circle_radius=2)
-
+class FaceMeshDetector(_FaceMeshDetector):
     def find_face_mesh(self, img, draw=True):
         """
         检测人脸并绘制 FaceMesh
         :param img: 输入图像
         :param draw: 是否绘制 FaceMesh
-        :return: 处理后的图像, 检测到的脸部关键点, 是否检测到人脸
+        :return: 处理后的图像, 检测到的脸部关键点 (n_faces, 468, 2) int16 数组, 是否检测到人脸
         """
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = self.faceMesh.process(imgRGB)
-        faces = []
-        if results.multi_face_landmarks:
-            for faceLms in results.multi_face_landmarks:
-                if draw:
-                    self.mpDraw.draw_landmarks(img, faceLms, self.mpFaceMesh.FACEMESH_TESSELATION,
-                                               self.drawSpec, self.drawSpec)
-                face = []
-                for id, lm in enumerate(faceLms.landmark):
-                    ih, iw, ic = img.shape
-                    x, y = int(lm.x * iw), int(lm.y * ih)
-                    face.append([x, y])
-                faces.append(face)
-        return img, faces, bool(results.multi_face_landmarks)
+        img, faces = super().find_face_mesh(img, draw=draw)
+        return img, faces, len(faces) > 0
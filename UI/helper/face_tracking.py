@@ -0,0 +1,181 @@
+# UI/helper/face_tracking.py
+import os
+import itertools
+import cv2
+import numpy as np
+from UI.helper.face_detection import locate_faces, HAAR_FALLBACK
+
+# 每隔多少帧做一次全帧检测, 其余帧只在人脸附近的小区域内跟踪 (1 表示每帧都检测)
+REDETECT_INTERVAL = int(os.environ.get("FER_REDETECT_INTERVAL", 10))
+MIN_TRACK_CONFIDENCE = 0.6  # 模板匹配的归一化相关系数低于它时立即重新检测
+SEARCH_MARGIN = 0.3  # 搜索区域向每边扩展人脸边长的比例, 即每帧允许的最大移动
+TEMPLATE_SIZE = 32  # 模板缩放到的大致边长 (像素), 按整数步长缩小, 搜索区域用同样的步长
+IOU_MATCH = 0.3  # 重新检测到的框与已有轨迹的 IoU 至少为它时沿用轨迹 ID
+
+
+def detect_with_mesh(detector, frame, fallback=HAAR_FALLBACK):
+    """
+    全帧检测: FaceMesh 找到的人脸框和对应的关键点; FaceMesh 没有找到人脸时可以退回 Haar, 此时没有关键点
+    :return: (boxes, faces), faces 为 (n_faces, 468, 2) 数组或 None
+    """
+    _, faces, _ = detector.find_face_mesh(frame, draw=False)
+    # 只保留与画面有交集的人脸, 这样每组关键点都得到一个框, 两者一一对应
+    height, width = frame.shape[:2]
+    inside = (faces.max(axis=1) > 0).all(axis=1) & (faces.min(axis=1) < (width, height)).all(axis=1)
+    faces = faces[inside]
+    boxes = locate_faces(frame, faces, fallback=fallback)
+    return boxes, faces if len(faces) > 0 else None
+
+
+def small_gray(region, step):
+    """
+    先缩小再转灰度, 只处理人脸附近的像素而不是整帧.
+    每 step×step 个像素取平均成一个像素, region 的边长应为 step 的整数倍, 这样缩小后的网格与原图的像素对齐
+    """
+    height, width = region.shape[:2]
+    region = cv2.resize(region, (width // step, height // step), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+
+
+def peak_offset(left, center, right):
+    """用抛物线拟合峰值两侧的得分, 返回峰值相对中间一格的亚像素偏移 (-0.5 到 0.5)"""
+    curvature = left - 2 * center + right
+    if curvature >= 0:
+        return 0.0
+    return min(max(0.5 * (left - right) / curvature, -0.5), 0.5)
+
+
+def box_iou(a, b):
+    x, y = max(a[0], b[0]), max(a[1], b[1])
+    x_end, y_end = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x_end - x) * max(0, y_end - y)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """一张被跟踪的人脸: 稳定的 ID, 当前的框, 随框平移的关键点 (可能为 None) 和最近一次跟踪的置信度"""
+
+    def __init__(self, track_id, box, landmarks, template, step):
+        self.track_id = track_id
+        self.box = box
+        self.landmarks = landmarks
+        self.template = template  # 检测时人脸区域的缩小灰度图, 从框的左上角开始
+        self.step = step  # 模板的一个像素对应原图 step×step 个像素
+        self.detected_box = box  # 检测时的框和关键点, 跟踪时相对它们平移
+        self.detected_landmarks = landmarks
+        self.position = (float(box[0]), float(box[1]))  # 跟踪到的框左上角, 保留小数, 框取它四舍五入后的位置
+        self.confidence = 1.0
+
+
+class FaceTracker:
+    """
+    先检测再跟踪: 检测之后的帧只在每张脸周围的小区域内做模板匹配 (缩小到 TEMPLATE_SIZE 后代价很低),
+    每 redetect_interval 帧, 或者任一轨迹的匹配置信度低于 min_confidence, 或者当前没有人脸时才做全帧检测.
+    重新检测时按 IoU 把新框对应到已有轨迹, 使每张脸的 ID 保持不变.
+    """
+
+    def __init__(self, detect, redetect_interval=REDETECT_INTERVAL, min_confidence=MIN_TRACK_CONFIDENCE,
+                 search_margin=SEARCH_MARGIN):
+        """
+        :param detect: 全帧检测函数 frame -> (boxes, faces), 例如 lambda frame: detect_with_mesh(detector, frame)
+        """
+        self.detect = detect
+        self.redetect_interval = max(1, redetect_interval)
+        self.min_confidence = min_confidence
+        self.search_margin = search_margin
+        self.tracks = []
+        self.frames_since_detection = 0
+        self._ids = itertools.count()
+        # 统计: 处理的帧数和其中做了全帧检测的帧数
+        self.frames = 0
+        self.detections = 0
+
+    def update(self, frame):
+        """处理一帧, 返回当前的轨迹列表"""
+        self.frames += 1
+        self.frames_since_detection += 1
+        if self.tracks and self.frames_since_detection < self.redetect_interval:
+            for track in self.tracks:
+                self._follow(frame, track)
+            if all(track.confidence >= self.min_confidence for track in self.tracks):
+                return self.tracks
+
+        # 全帧检测, 并与已有轨迹对应
+        boxes, faces = self.detect(frame)
+        self.detections += 1
+        self.frames_since_detection = 0
+        self.tracks = self._match(frame, boxes, faces)
+        return self.tracks
+
+    @property
+    def detection_rate(self):
+        """做了全帧检测的帧所占的比例"""
+        return self.detections / self.frames if self.frames else 0.0
+
+    def _template(self, frame, box):
+        # 整数步长: 搜索区域与模板的原点相差整数个步长时, 两者缩小后的网格完全对齐
+        x, y, x_end, y_end = box
+        step = max(1, round(max(x_end - x, y_end - y) / TEMPLATE_SIZE))
+        width, height = (x_end - x) // step * step, (y_end - y) // step * step
+        return small_gray(frame[y:y + height, x:x + width], step), step
+
+    def _match(self, frame, boxes, faces):
+        # 贪心地把 IoU 最大的 (新框, 旧轨迹) 配对
+        pairs = sorted(((box_iou(box, track.box), i, track)
+                        for i, box in enumerate(boxes) for track in self.tracks),
+                       key=lambda pair: pair[0], reverse=True)
+        assigned, used = {}, set()
+        for iou, i, track in pairs:
+            if iou < IOU_MATCH:
+                break
+            if i not in assigned and track.track_id not in used:
+                assigned[i] = track.track_id
+                used.add(track.track_id)
+
+        tracks = []
+        for i, box in enumerate(boxes):
+            track_id = assigned[i] if i in assigned else next(self._ids)
+            landmarks = faces[i].copy() if faces is not None else None
+            tracks.append(Track(track_id, box, landmarks, *self._template(frame, box)))
+        return tracks
+
+    def _follow(self, frame, track):
+        """在框周围的搜索区域内匹配检测时的模板, 平移框和关键点"""
+        step = track.step
+        th, tw = track.template.shape
+        height, width = frame.shape[:2]
+        x, y, x_end, y_end = track.detected_box
+        # 离当前位置最近的网格点: 与检测时的框相差整数个步长, 静止的人脸正好匹配在这一点上
+        gx = x + step * round((track.position[0] - x) / step)
+        gy = y + step * round((track.position[1] - y) / step)
+        # 搜索区域向每边扩展 margin 个步长, 在画面内截断时也只去掉整数个步长
+        margin = int(np.ceil(self.search_margin * max(tw, th)))
+        sx, sy = gx - margin * step, gy - margin * step
+        sx, sy = sx if sx >= 0 else sx % step, sy if sy >= 0 else sy % step
+        sx_end = sx + (min(width, gx + (tw + margin) * step) - sx) // step * step
+        sy_end = sy + (min(height, gy + (th + margin) * step) - sy) // step * step
+        if th == 0 or tw == 0 or sx_end - sx < tw * step or sy_end - sy < th * step:
+            track.confidence = 0.0  # 人脸移出了画面边缘
+            return
+        search = small_gray(frame[sy:sy_end, sx:sx_end], step)
+        scores = cv2.matchTemplate(search, track.template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, (mx, my) = cv2.minMaxLoc(scores)
+        track.confidence = confidence
+
+        # 在峰值附近做亚像素插值, 位置不再局限于步长的整数倍
+        rows, cols = scores.shape
+        offset_x = peak_offset(*scores[my, mx - 1:mx + 2]) if 0 < mx < cols - 1 else 0.0
+        offset_y = peak_offset(*scores[my - 1:my + 2, mx]) if 0 < my < rows - 1 else 0.0
+        # 框的大小不变, 只平移并限制在画面内; 尺度变化留给下一次全帧检测
+        px = min(max(sx + (mx + offset_x) * step, 0), width - (x_end - x))
+        py = min(max(sy + (my + offset_y) * step, 0), height - (y_end - y))
+        # 最佳匹配仍是当前网格点且移动不到一个像素时框保持不动, 噪声不会让静止的人脸抖动
+        if (sx + mx * step, sy + my * step) == (gx, gy) and \
+                abs(px - track.position[0]) < 1 and abs(py - track.position[1]) < 1:
+            return
+        track.position = (px, py)
+        dx, dy = int(round(px)) - x, int(round(py)) - y
+        track.box = (x + dx, y + dy, x_end + dx, y_end + dy)
+        if track.detected_landmarks is not None:
+            track.landmarks = track.detected_landmarks + np.array([dx, dy], dtype=track.detected_landmarks.dtype)
@@ -0,0 +1,155 @@
+# UI/helper/frame_transport.py
+import os
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+
+# 实时画面的传输方式: "image" 把 JPEG 字节交给 st.image, "mjpeg" 由本地 HTTP 线程提供 MJPEG 流, 通过环境变量 FER_FRAME_TRANSPORT 选择
+FRAME_TRANSPORT = os.environ.get("FER_FRAME_TRANSPORT", "image")
+JPEG_QUALITY = int(os.environ.get("FER_JPEG_QUALITY", 75))  # 0-100, 越低每帧字节越少
+DISPLAY_FPS = float(os.environ.get("FER_DISPLAY_FPS", 20))  # 最多每秒发送的帧数
+# MJPEG 服务监听的地址; 默认只接受本机浏览器, 其他机器上的浏览器需要 FER_MJPEG_HOST=0.0.0.0
+MJPEG_HOST = os.environ.get("FER_MJPEG_HOST", "localhost")
+# 不在 Streamlit 从 8501 开始递增寻找空闲端口的范围内, 第二个应用实例不会与它冲突
+MJPEG_PORT = int(os.environ.get("FER_MJPEG_PORT", 8765))
+BOUNDARY = "frame"
+
+
+class FrameEncoder:
+    """
+    直接把 BGR 帧编码为 JPEG (不经过 RGB 转换, PIL 和 base64), 并统计最近若干帧的平均字节数和编码耗时
+    """
+
+    def __init__(self, quality=JPEG_QUALITY, window=30):
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self._sizes = deque(maxlen=window)
+        self._seconds = deque(maxlen=window)
+
+    def encode(self, frame):
+        """:return: JPEG 字节"""
+        start = time.perf_counter()
+        ok, buffer = cv2.imencode(".jpg", frame, self.params)
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        self._seconds.append(time.perf_counter() - start)
+        self._sizes.append(buffer.nbytes)
+        return buffer.tobytes()
+
+    @property
+    def bytes_per_frame(self):
+        return sum(self._sizes) / len(self._sizes) if self._sizes else 0.0
+
+    @property
+    def encode_ms(self):
+        return sum(self._seconds) / len(self._seconds) * 1000 if self._seconds else 0.0
+
+
+class FrameThrottle:
+    """把发送限制在 fps 帧每秒, 多出来的帧在绘制和编码之前就跳过"""
+
+    def __init__(self, fps=DISPLAY_FPS):
+        self.interval = 1 / fps if fps > 0 else 0.0
+        self._next = 0.0
+
+    def ready(self):
+        now = time.perf_counter()
+        if now < self._next:
+            return False
+        # 按固定节拍前进, 落后太多时从当前时间重新开始
+        self._next = max(self._next + self.interval, now)
+        return True
+
+
+class MjpegServer:
+    """
+    在后台线程中运行的本地 HTTP 服务, 以 multipart/x-mixed-replace 流 (MJPEG) 提供最新的 JPEG 帧.
+    浏览器用一个 <img> 直接拉流, 画面不再经过 Streamlit 的 websocket; 每个客户端只收到它还没收到的最新一帧.
+    """
+
+    def __init__(self, host=MJPEG_HOST, port=MJPEG_PORT):
+        self._frame = None
+        self._frame_id = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/stream.mjpg":
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                frame_id = 0
+                try:
+                    while True:
+                        frame, frame_id = server.wait_frame(frame_id)
+                        if frame is None:
+                            break
+                        self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(frame)}\r\n\r\n".encode())
+                        self.wfile.write(frame)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 浏览器关闭了页面
+
+            def log_message(self, format, *args):
+                pass  # 不为每个请求打印日志
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.host = host
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mjpeg-server", daemon=True)
+        self._thread.start()
+
+    def url(self, browser_host=None):
+        """
+        页面中 <img> 使用的地址
+        :param browser_host: 浏览器访问 Streamlit 时使用的主机名, 为 None 时使用监听地址
+        """
+        host = browser_host or self.host
+        if host in ("0.0.0.0", "::"):
+            host = "localhost"
+        return f"http://{host}:{self.port}/stream.mjpg"
+
+    def publish(self, jpeg):
+        """发布新的一帧 JPEG 字节"""
+        with self._condition:
+            self._frame = jpeg
+            self._frame_id += 1
+            self._condition.notify_all()
+
+    def wait_frame(self, last_id, timeout=1.0):
+        """等待比 last_id 新的帧, 返回 (帧, 帧编号); 服务关闭后返回 (None, last_id)"""
+        with self._condition:
+            while not self._closed and self._frame_id == last_id:
+                self._condition.wait(timeout)
+            if self._closed:
+                return None, last_id
+            return self._frame, self._frame_id
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+_mjpeg_server = None
+_mjpeg_lock = threading.Lock()
+
+
+def get_mjpeg_server():
+    """进程内唯一的 MJPEG 服务, Streamlit 每次重新运行脚本都复用同一个端口"""
+    global _mjpeg_server
+    if _mjpeg_server is None:
+        with _mjpeg_lock:
+            if _mjpeg_server is None:
+                _mjpeg_server = MjpegServer()
+    return _mjpeg_server
@@ -0,0 +1,126 @@
+# UI/helper/live_pipeline.py
+import time
+import threading
+from collections import deque
+
+
+class DropOldestQueue:
+    """有界队列: 满了时丢弃最旧的元素而不是让生产者等待, 过时的帧不会堆积"""
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.dropped = 0  # 被丢弃的元素个数
+        self._items = deque()
+        self._condition = threading.Condition()
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """取出最旧的元素, 超时返回 None"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+
+class RateMeter:
+    """最近若干次事件的频率 (每秒次数)"""
+
+    def __init__(self, window=30):
+        self._times = deque(maxlen=window)
+
+    def tick(self):
+        self._times.append(time.perf_counter())
+
+    @property
+    def rate(self):
+        if len(self._times) < 2:
+            return 0.0
+        return (len(self._times) - 1) / (self._times[-1] - self._times[0])
+
+
+class LivePipeline:
+    """
+    实时画面的三段流水线: 采集线程读取摄像头, 分析线程 (人脸跟踪 + 情绪预测) 处理最新的帧,
+    显示由调用方 (Streamlit 脚本线程) 通过 next_frame() 取最新的帧和最近一次的分析结果.
+    阶段之间是容量为 queue_size 的丢弃最旧队列, 所以显示帧率只受采集和显示限制, 不受推理速度限制,
+    分析慢时跳过的是旧帧而不是让它们排队. 分析线程中的异常在下一次 next_frame() 时抛出.
+    """
+
+    def __init__(self, capture, analyze, queue_size=1):
+        """
+        :param capture: 已打开的 cv2.VideoCapture
+        :param analyze: 分析函数 frame -> 结果, 在分析线程中运行, 不得修改 frame
+        """
+        self.capture = capture
+        self.analyze = analyze
+        self.analysis_queue = DropOldestQueue(queue_size)
+        self.display_queue = DropOldestQueue(queue_size)
+        self.result = None  # 最近一次的分析结果
+        self.capture_rate = RateMeter()
+        self.analysis_rate = RateMeter()
+        self.display_rate = RateMeter()
+        self._stop = threading.Event()
+        self._error = None
+        self._threads = [threading.Thread(target=self._capture_loop, name="live-capture", daemon=True),
+                         threading.Thread(target=self._analysis_loop, name="live-analysis", daemon=True)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """停止线程并释放摄像头"""
+        self._stop.set()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join()
+        self.capture.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            ret, frame = self.capture.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            self.capture_rate.tick()
+            self.analysis_queue.put(frame)
+            self.display_queue.put(frame)
+
+    def _analysis_loop(self):
+        while not self._stop.is_set():
+            frame = self.analysis_queue.get(timeout=0.1)
+            if frame is None:
+                continue
+            try:
+                self.result = self.analyze(frame)
+            except Exception as e:
+                self._error = e
+                return
+            self.analysis_rate.tick()
+
+    def next_frame(self, timeout=1.0):
+        """
+        等待下一帧
+        :return: (帧, 最近一次的分析结果), 超时 (摄像头没有画面) 返回 (None, None)
+        """
+        if self._error is not None:
+            raise RuntimeError("Live analysis failed") from self._error
+        frame = self.display_queue.get(timeout)
+        if frame is None:
+            return None, None
+        self.display_rate.tick()
+        return frame, self.result
@@ -0,0 +1,89 @@
+# UI/helper/prediction_scheduler.py
+import os
+import cv2
+import numpy as np
+from train.cnn_config import LABELS
+from UI.helper.emotion_model import predict_emotions
+from UI.helper.utils import convert_frame_to_image
+
+# 人脸缩略图与上次预测时的平均灰度差 (0-255) 超过它才重新运行 CNN, 通过环境变量 FER_CHANGE_THRESHOLD 调整
+CHANGE_THRESHOLD = float(os.environ.get("FER_CHANGE_THRESHOLD", 6.0))
+MAX_REUSE = 15  # 一次预测最多被沿用的帧数, 之后无论是否变化都重新预测
+SMOOTHING = 0.4  # 指数移动平均中新预测的权重, 越小标签越稳定
+THUMBNAIL_SIZE = 16  # 比较变化用的灰度缩略图边长
+
+
+def face_thumbnail(frame, box):
+    """人脸区域的小灰度缩略图, 用来低成本地判断人脸是否变化"""
+    x, y, x_end, y_end = box
+    thumbnail = cv2.resize(frame[y:y_end, x:x_end], (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+class TrackPrediction:
+    """一个轨迹最近一次预测时的缩略图, 平滑后的概率, 以及此后沿用的帧数"""
+
+    def __init__(self, thumbnail, probs):
+        self.thumbnail = thumbnail
+        self.probs = probs
+        self.age = 0
+
+
+class PredictionScheduler:
+    """
+    按人脸轨迹调度情绪预测: 人脸缩略图与上次预测时相比变化不大时沿用上次的结果,
+    只把变化了 (或沿用太久) 的人脸一起送入 CNN; 每个轨迹的概率用指数移动平均平滑, 标签不再闪烁.
+    """
+
+    def __init__(self, predict=predict_emotions, change_threshold=CHANGE_THRESHOLD, max_reuse=MAX_REUSE,
+                 smoothing=SMOOTHING):
+        """
+        :param predict: 批量预测函数, PIL图像列表 -> [(标签, 概率), ...]
+        """
+        self.predict = predict
+        self.change_threshold = change_threshold
+        self.max_reuse = max_reuse
+        self.smoothing = smoothing
+        self.states = {}  # track_id -> TrackPrediction
+        # 统计: 请求预测的人脸数和实际送入 CNN 的人脸数
+        self.requested = 0
+        self.predicted = 0
+
+    def update(self, frame, tracks):
+        """
+        :param tracks: FaceTracker 的轨迹列表
+        :return: 每个轨迹的 (标签, 平滑后的概率) 列表
+        """
+        thumbnails = [face_thumbnail(frame, track.box) for track in tracks]
+        stale = [i for i, (track, thumbnail) in enumerate(zip(tracks, thumbnails))
+                 if self._needs_prediction(track.track_id, thumbnail)]
+        if stale:
+            predictions = self.predict([convert_frame_to_image(frame, *tracks[i].box) for i in stale])
+            for i, (_, probs) in zip(stale, predictions):
+                previous = self.states.get(tracks[i].track_id)
+                if previous is not None:
+                    probs = self.smoothing * probs + (1 - self.smoothing) * previous.probs
+                self.states[tracks[i].track_id] = TrackPrediction(thumbnails[i], probs)
+        self.requested += len(tracks)
+        self.predicted += len(stale)
+
+        # 消失的轨迹不再保留
+        track_ids = {track.track_id for track in tracks}
+        self.states = {track_id: state for track_id, state in self.states.items() if track_id in track_ids}
+        results = []
+        for track in tracks:
+            state = self.states[track.track_id]
+            state.age += 1
+            results.append((LABELS[int(state.probs.argmax())], state.probs))
+        return results
+
+    @property
+    def reuse_rate(self):
+        """沿用上次结果而没有运行 CNN 的人脸所占的比例"""
+        return 1 - self.predicted / self.requested if self.requested else 0.0
+
+    def _needs_prediction(self, track_id, thumbnail):
+        state = self.states.get(track_id)
+        if state is None or state.age >= self.max_reuse:
+            return True
+        return float(np.abs(thumbnail - state.thumbnail).mean()) > self.change_threshold
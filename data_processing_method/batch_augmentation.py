@@ -0,0 +1,88 @@
+import numpy as np
+
+# Augmentation of the CNN training batches, the same ranges as the former per-image torchvision transforms
+AUGMENTATION = {
+    'rotation': 10,            # Degrees, uniform in [-rotation, rotation]
+    'translation': 0,          # Fraction of the width / height, uniform in [-translation, translation], off as before
+    'crop_scale': (0.8, 1.0),  # Area of the random crop that is zoomed to the full image, as RandomResizedCrop
+    'flip': 0.5,               # Probability of a horizontal flip
+    'brightness': 0.2,         # Factor uniform in [1 - brightness, 1 + brightness]
+    'contrast': 0.2,           # Factor uniform in [1 - contrast, 1 + contrast]
+}
+
+
+def sample_affine(n, width, height, rotation=10, translation=0.1, crop_scale=(1.0, 1.0), flip=0.5, rng=np.random):
+    """
+    Random geometric augmentation of n images as one (n, 2, 3) float32 matrix each, in pixel coordinates
+    mapping source to destination like cv2.warpAffine expects: rotation, zoom into a random crop and
+    horizontal flip about the image center, followed by a translation.
+    translation is a fraction of the image size, or a (x, y) pair of fractions.
+    """
+    tx_max, ty_max = translation if isinstance(translation, (tuple, list)) else (translation, translation)
+    angles = np.deg2rad(rng.uniform(-rotation, rotation, n))
+    # Zooming by 1 / sqrt(area) shows a crop covering that area of the image
+    zooms = 1 / np.sqrt(rng.uniform(crop_scale[0], crop_scale[1], n))
+    signs = np.where(rng.random(n) < flip, -1.0, 1.0)
+    shifts_x = rng.uniform(-tx_max, tx_max, n) * width
+    shifts_y = rng.uniform(-ty_max, ty_max, n) * height
+
+    cx, cy = (width - 1) / 2, (height - 1) / 2
+    cos, sin = np.cos(angles) * zooms, np.sin(angles) * zooms
+    matrices = np.empty((n, 2, 3), dtype=np.float32)
+    # [x', y'] = R * Z * F * ([x, y] - c) + c + shift, with F flipping x
+    matrices[:, 0, 0] = cos * signs
+    matrices[:, 0, 1] = sin
+    matrices[:, 1, 0] = -sin * signs
+    matrices[:, 1, 1] = cos
+    matrices[:, 0, 2] = cx + shifts_x - matrices[:, 0, 0] * cx - matrices[:, 0, 1] * cy
+    matrices[:, 1, 2] = cy + shifts_y - matrices[:, 1, 0] * cx - matrices[:, 1, 1] * cy
+    return matrices
+
+
+def affine_to_theta(matrices, width, height):
+    """
+    Convert source -> destination pixel matrices into the destination -> source matrices in normalized
+    [-1, 1] coordinates that torch.nn.functional.affine_grid takes (align_corners=False)
+    """
+    n = len(matrices)
+    full = np.zeros((n, 3, 3), dtype=np.float64)
+    full[:, :2] = matrices
+    full[:, 2, 2] = 1
+    normalize = np.array([[2 / width, 0, 1 / width - 1], [0, 2 / height, 1 / height - 1], [0, 0, 1]])
+    theta = normalize @ np.linalg.inv(full) @ np.linalg.inv(normalize)
+    return theta[:, :2].astype(np.float32)
+
+
+class BatchAugmenter:
+    """
+    Augments a whole batch of images at once: one affine grid per image (rotation, translation, crop-scale
+    and flip composed) applied with a single grid_sample call, then brightness and contrast as tensor ops.
+    Takes uint8 or [0, 1] float tensors of shape (N, C, H, W), on any device, and returns [0, 1] floats.
+    """
+
+    def __init__(self, seed=None, **params):
+        self.params = dict(AUGMENTATION, **params)
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, images):
+        import torch
+        import torch.nn.functional as F
+
+        images = images.float().div_(255) if images.dtype == torch.uint8 else images.float()
+        n, _, height, width = images.shape
+        p = self.params
+        matrices = sample_affine(n, width, height, p['rotation'], p['translation'], p['crop_scale'], p['flip'],
+                                 self.rng)
+        theta = torch.from_numpy(affine_to_theta(matrices, width, height)).to(images.device)
+        grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+        images = F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+        # Contrast blends every image with its mean intensity, brightness scales it
+        factors = torch.from_numpy(self.rng.uniform(
+            [1 - p['contrast'], 1 - p['brightness']], [1 + p['contrast'], 1 + p['brightness']],
+            (n, 2)).astype(np.float32)).to(images.device)
+        contrast = factors[:, 0].view(n, 1, 1, 1)
+        brightness = factors[:, 1].view(n, 1, 1, 1)
+        mean = images.mean(dim=(1, 2, 3), keepdim=True)
+        images = ((images - mean) * contrast + mean) * brightness
+        return images.clamp_(0, 1)
@@ -0,0 +1,169 @@
+import os
+import json
+import glob
+import hashlib
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+from helper.dataset_manifest import load_manifest
+from helper.pack_dataset import PACKED_DIR, packed_paths, is_packed, split_digest
+from train.cnn_model import (IMG_SIZE, NORMALIZE_MEAN, NORMALIZE_STD, build_train_transform, build_eval_transform,
+                             build_uint8_transform, normalize_transform)
+
+EVAL_CACHE_DIR = "cache/eval_tensors"
+
+
+class ManifestImageDataset(Dataset):
+    """
+    Drop-in replacement for torchvision's ImageFolder that reads the image list from the dataset manifest
+    instead of walking the folders. Returns (transformed image, label id), classes are the manifest labels.
+    Images are opened as RGB, or as single channel grayscale with channels=1.
+    """
+
+    def __init__(self, root="archive", split="train", transform=None, manifest=None, channels=3):
+        manifest = manifest or load_manifest(root)
+        self.classes = manifest.labels
+        self.samples = [(entry.path, entry.label_id) for entry in manifest.split(split)]
+        self.targets = [label_id for _, label_id in self.samples]
+        self.transform = transform
+        self.mode = "L" if channels == 1 else "RGB"
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        path, label_id = self.samples[index]
+        with open(path, 'rb') as f:
+            image = Image.open(f).convert(self.mode)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, label_id
+
+
+class PackedFERDataset(Dataset):
+    """
+    Serves a split packed by helper/pack_dataset.py straight from the memory-mapped uint8 array,
+    no JPEG decode or file open per sample. Images come out as float tensors in [0, 1] of shape
+    (channels, H, W), the grayscale plane repeated when channels is 3, so only tensor transforms apply.
+    With as_uint8=True they stay uint8 in [0, 255], a quarter of the size to pass between processes.
+    """
+
+    def __init__(self, split="train", packed_dir=PACKED_DIR, transform=None, channels=3, as_uint8=False):
+        self.images_path, labels_path, meta_path = packed_paths(packed_dir, split)
+        with open(meta_path) as f:
+            self.classes = json.load(f)['classes']
+        self.labels = np.load(labels_path)
+        self.targets = self.labels.tolist()
+        self.transform = transform
+        self.channels = channels
+        self.as_uint8 = as_uint8
+        self.images = None  # Mapped on first access, so every DataLoader worker maps the file itself
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['images'] = None
+        return state
+
+    def __getitem__(self, index):
+        if self.images is None:
+            self.images = np.load(self.images_path, mmap_mode='r')
+        image = torch.from_numpy(np.array(self.images[index])).unsqueeze(0)
+        if not self.as_uint8:
+            image = image.float().div_(255)
+        if self.channels != 1:
+            image = image.expand(self.channels, -1, -1)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, int(self.labels[index])
+
+
+def load_split(split, train, in_channels=3, root="archive", manifest=None, batch_augment=False):
+    """
+    Dataset of a split with the training (augmented) or evaluation preprocessing. Served from the packed
+    uint8 arrays when they are up to date (python -m helper.pack_dataset), otherwise decoded from the
+    JPEG files listed in the manifest.
+    With train and batch_augment the images come out as unaugmented uint8 tensors, to be augmented and
+    normalized a whole batch at a time by BatchAugmenter.
+    """
+    manifest = manifest or load_manifest(root)
+    batch_augment = train and batch_augment
+    if is_packed(manifest, split, img_size=IMG_SIZE):
+        if batch_augment:
+            return PackedFERDataset(split=split, channels=in_channels, as_uint8=True)
+        transform = build_train_transform(in_channels, packed=True) if train else normalize_transform(in_channels)
+        return PackedFERDataset(split=split, transform=transform, channels=in_channels)
+    if batch_augment:
+        transform = build_uint8_transform()
+    else:
+        transform = build_train_transform(in_channels) if train else build_eval_transform(in_channels)
+    return ManifestImageDataset(root=root, split=split, transform=transform, manifest=manifest, channels=in_channels)
+
+
+def eval_cache_key(manifest, split, in_channels):
+    """Digest of everything the preprocessed evaluation tensors depend on"""
+    settings = {'images': split_digest(manifest.split(split)), 'img_size': list(IMG_SIZE), 'channels': in_channels,
+                'mean': NORMALIZE_MEAN, 'std': NORMALIZE_STD}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def cached_eval_tensors(split, in_channels=3, root="archive", manifest=None, cache_dir=EVAL_CACHE_DIR):
+    """
+    A split with the deterministic evaluation preprocessing as one normalized float32 (N, C, H, W) tensor
+    plus an int64 label tensor. They are materialized once into .npy files keyed by the split's images,
+    the image size, the channels and the normalization, so changing any of those rebuilds the cache;
+    afterwards they are memory-mapped, and evaluating needs no decoding or transforms at all.
+    """
+    manifest = manifest or load_manifest(root)
+    key = eval_cache_key(manifest, split, in_channels)
+    images_path = os.path.join(cache_dir, f"{split}_{in_channels}ch_{key}_images.npy")
+    labels_path = os.path.join(cache_dir, f"{split}_{in_channels}ch_{key}_labels.npy")
+
+    if not os.path.exists(labels_path):
+        # Stale caches of the same split and channels are replaced
+        for stale in glob.glob(os.path.join(cache_dir, f"{split}_{in_channels}ch_*.npy")):
+            os.remove(stale)
+        os.makedirs(cache_dir, exist_ok=True)
+        dataset = load_split(split, train=False, in_channels=in_channels, root=root, manifest=manifest)
+        images = np.lib.format.open_memmap(images_path + ".tmp", mode='w+', dtype=np.float32,
+                                           shape=(len(dataset), in_channels, IMG_SIZE[1], IMG_SIZE[0]))
+        labels = np.empty(len(dataset), dtype=np.int64)
+        start = 0
+        for batch_images, batch_labels in DataLoader(dataset, batch_size=256):
+            images[start:start + len(batch_images)] = batch_images.numpy()
+            labels[start:start + len(batch_labels)] = batch_labels.numpy()
+            start += len(batch_images)
+        images.flush()
+        del images
+        # The labels file is written last, it marks the cache as complete
+        os.replace(images_path + ".tmp", images_path)
+        np.save(labels_path, labels)
+        print(f"Cached {split} evaluation tensors in {images_path}")
+
+    # Copy-on-write mapping: pages are read on demand and shared, the tensors are writable for torch
+    images = torch.from_numpy(np.load(images_path, mmap_mode='c'))
+    labels = torch.from_numpy(np.load(labels_path))
+    return images, labels
+
+
+class TensorBatches:
+    """
+    Iterates over (images, labels) slices of preloaded tensors, in order. With world_size > 1 each rank
+    gets a contiguous shard, so the ranks together cover every sample exactly once.
+    """
+
+    def __init__(self, images, labels, batch_size, rank=0, world_size=1):
+        shard = (len(labels) + world_size - 1) // world_size
+        self.images = images[rank * shard:(rank + 1) * shard]
+        self.labels = labels[rank * shard:(rank + 1) * shard]
+        self.batch_size = batch_size
+
+    def __len__(self):
+        return (len(self.labels) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        for start in range(0, len(self.labels), self.batch_size):
+            yield self.images[start:start + self.batch_size], self.labels[start:start + self.batch_size]
@@ -1,8 +1,8 @@
 import cv2
 import numpy as np
 import gc  # Import garbage collection module
-from data_augmentation import augment_image  # Import data augmentation method
-from image_normalization import normalize_image  # Import image normalization method
+from data_processing_method.data_augmentation import augment_image  # Import data augmentation method
+from data_processing_method.image_normalization import normalize_image  # Import image normalization method
 
 
 def process_image_for_cnn(img_path, target_size=(64, 64)):
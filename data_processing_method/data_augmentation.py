@@ -1,25 +1,14 @@
 # data_augmentation.py
 import cv2
-import numpy as np
+from data_processing_method.batch_augmentation import sample_affine
 
 
 def augment_image(img):
-    # Randomly rotate the image
-    angle = np.random.uniform(-10, 10)
+    # Random rotation (+-10 degrees), translation (+-10 pixels) and horizontal flip,
+    # composed into one matrix so the image is resampled by a single warpAffine
     h, w = img.shape[:2]
-    M = cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1)
-    rotated_img = cv2.warpAffine(img, M, (w, h))
-
-    # Randomly translate the image
-    tx = np.random.uniform(-10, 10)
-    ty = np.random.uniform(-10, 10)
-    M = np.float32([[1, 0, tx], [0, 1, ty]])
-    translated_img = cv2.warpAffine(rotated_img, M, (w, h))
-
-    # Random horizontal flip
-    flipped_img = cv2.flip(translated_img, 1) if np.random.random() < 0.5 else translated_img
-
-    return flipped_img
+    M = sample_affine(1, w, h, rotation=10, translation=(10 / w, 10 / h), flip=0.5)[0]
+    return cv2.warpAffine(img, M, (w, h))
 
 
 def main():
@@ -1,7 +1,10 @@
 
 import cv2
+import numpy as np
 import mediapipe as mp
 
+NUM_LANDMARKS = 468  # Number of landmarks MediaPipe FaceMesh returns per face
+
 
 class FaceMeshDetector():
     def __init__(self, staticMode=False, maxFace=2, minDetectionCon=0.5, minTrackCon=0.5):
@@ -19,24 +22,48 @@ class FaceMeshDetector():
             min_tracking_confidence=self.minTrackCon
         )
         self.drawSpec = self.mpDraw.DrawingSpec(thickness=1, circle_radius=2)
+        # Landmark index pairs of the tesselation, for drawing the mesh from pixel coordinates
+        self.meshEdges = np.array(sorted(self.mpFaceMesh.FACEMESH_TESSELATION), dtype=np.int32)
 
     def find_face_mesh(self, img, draw=True):
+        """
+        Detect faces and optionally draw the FaceMesh on img
+        :return: img, int16 array of shape (n_faces, 468, 2) holding the (x, y) pixel position of every landmark
+        """
         imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         results = self.faceMesh.process(imgRGB)
-        faces = []
-        if results.multi_face_landmarks:
+        if not results.multi_face_landmarks:
+            return img, np.empty((0, NUM_LANDMARKS, 2), dtype=np.int16)
+
+        if draw:
             for faceLms in results.multi_face_landmarks:
-                if draw:
-                    self.mpDraw.draw_landmarks(img, faceLms, self.mpFaceMesh.FACEMESH_TESSELATION,
-                                               self.drawSpec, self.drawSpec)
-                face = []
-                for id, lm in enumerate(faceLms.landmark):
-                    ih, iw, ic = img.shape
-                    x, y = int(lm.x * iw), int(lm.y * ih)
-                    face.append([x, y])
-                faces.append(face)
+                self.mpDraw.draw_landmarks(img, faceLms, self.mpFaceMesh.FACEMESH_TESSELATION,
+                                           self.drawSpec, self.drawSpec)
+
+        # Read every normalized coordinate into one flat float32 buffer, then scale all of them at once
+        ih, iw = img.shape[:2]
+        n_faces = len(results.multi_face_landmarks)
+        coords = np.fromiter(
+            (v for faceLms in results.multi_face_landmarks for lm in faceLms.landmark for v in (lm.x, lm.y)),
+            dtype=np.float32, count=n_faces * NUM_LANDMARKS * 2
+        ).reshape(n_faces, NUM_LANDMARKS, 2)
+        coords *= np.array([iw, ih], dtype=np.float32)
+        faces = coords.astype(np.int16)  # Truncates like int(), matching the old pixel positions
         return img, faces
 
+    def draw_face_mesh(self, img, faces):
+        """
+        Draw the tesselation of landmarks already in pixel coordinates, e.g. landmarks moved along by a face
+        tracker on frames where FaceMesh did not run, in the same color as find_face_mesh draws
+        """
+        color = self.drawSpec.color
+        for face in faces:
+            lines = face[self.meshEdges].astype(np.int32)  # (n_edges, 2 endpoints, 2)
+            cv2.polylines(img, lines, False, color, self.drawSpec.thickness)
+            for x, y in face.tolist():
+                cv2.circle(img, (x, y), self.drawSpec.circle_radius, color, self.drawSpec.thickness)
+        return img
+
 
 def main():
     detector = FaceMeshDetector()
@@ -1,12 +1,37 @@
+import os
+import time
 import cv2
 import numpy as np
-import gc  # Import garbage collection module
-from data_augmentation import augment_image  # Import data augmentation method
-from image_normalization import normalize_image  # Import image normalization method
-from face_mesh_module import FaceMeshDetector  # Import face keypoint detection class
+from multiprocessing import Pool
+from data_processing_method.data_augmentation import augment_image  # Import data augmentation method
+from data_processing_method.image_normalization import normalize_image  # Import image normalization method
+from data_processing_method.face_mesh_module import FaceMeshDetector  # Import face keypoint detection class
 
+# Detector settings used for keypoint extraction. FER images hold a single face,
+# and every image is unrelated to the previous one, so run MediaPipe in static mode.
+DETECTOR_CONFIG = {
+    'staticMode': True,
+    'maxFace': 1,
+    'minDetectionCon': 0.5,
+    'minTrackCon': 0.5,
+}
 
-def process_image(img_path):
+# Everything that influences the extracted keypoints, used to key the landmark cache.
+# Features are extracted without random augmentation, so the keypoints of an image are deterministic and cacheable.
+EXTRACTION_CONFIG = dict(DETECTOR_CONFIG, image_size=256, augment=False)
+
+# One detector per process, created on first use and reused for every image afterwards
+_detector = None
+
+
+def get_detector():
+    global _detector
+    if _detector is None:
+        _detector = FaceMeshDetector(**DETECTOR_CONFIG)
+    return _detector
+
+
+def process_image(img_path, draw=True, augment=True):
     # 1. Read the image
     img = cv2.imread(img_path)
 
@@ -22,25 +47,67 @@ def process_image(img_path):
     img = np.clip(img, 0, 1)
 
     # 3. Image augmentation
-    img = augment_image(img)
+    if augment:
+        img = augment_image(img)
 
-    # Ensure the augmented image is within the [0, 1] range
-    img = np.clip(img, 0, 1)
+        # Ensure the augmented image is within the [0, 1] range
+        img = np.clip(img, 0, 1)
 
-    # 4. Face keypoint extraction
-    detector = FaceMeshDetector()
+    # 4. Face keypoint extraction with the detector of this process
     img = cv2.resize(img, (256, 256))  # Resize for MediaPipe processing
     img = (img * 255).astype('uint8')
-    final_img, faces = detector.find_face_mesh(img, draw=True)
-
-    # Release memory no longer needed after processing
-    del img
-    gc.collect()  # Invoke garbage collection to free memory
+    final_img, faces = get_detector().find_face_mesh(img, draw=draw)
 
     # Return the final processed image
     return final_img, faces
 
 
+def _extract_keypoints(img_path):
+    # The detector is built on the first image of each worker, not in a pool initializer:
+    # an initializer that raises makes the pool respawn workers forever, while an error
+    # raised here is sent back to the caller by imap
+    _, faces = process_image(img_path, draw=False, augment=EXTRACTION_CONFIG['augment'])
+    return faces
+
+
+class DetectorPool:
+    """Long-lived pool of worker processes, each holding its own FaceMesh detector."""
+
+    def __init__(self, processes=None, chunksize=16):
+        self.processes = processes or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.pool = Pool(self.processes)
+
+    def imap(self, img_paths):
+        """Yield the face keypoints of every image, in the order of img_paths."""
+        return self.pool.imap(_extract_keypoints, img_paths, chunksize=self.chunksize)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.pool.terminate()
+
+
+def process_images(img_paths, processes=None, chunksize=16):
+    """Extract face keypoints for a list of images using all cores, returns one entry per path."""
+    img_paths = list(img_paths)
+    start = time.perf_counter()
+    with DetectorPool(processes, chunksize) as pool:
+        results = list(pool.imap(img_paths))
+    elapsed = time.perf_counter() - start
+    rate = len(img_paths) / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {len(img_paths)} images in {elapsed:.1f}s ({rate:.1f} images/sec, {pool.processes} processes)")
+    return results
+
+
 def main():
     # Image path
     img_path = "archive/train/angry/angry1/Training_3908.jpg"  # Adjust image path as needed
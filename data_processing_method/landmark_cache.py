@@ -0,0 +1,104 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# One cached face: (x, y) of the 468 FaceMesh landmarks. Defined here rather than imported from
+# face_mesh_module so that hashing images does not pull in mediapipe.
+ROW_SHAPE = (468, 2)
+ROW_BYTES = 468 * 2 * np.dtype(np.int16).itemsize
+
+
+def file_digest(path):
+    """SHA-1 of the file content, used as the cache key of an image"""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def config_digest(config):
+    """Short digest of the detector / preprocessing settings the landmarks were produced with"""
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class LandmarkCache:
+    """
+    On-disk landmark store keyed by image content hash.
+    Every detector configuration gets its own directory holding:
+      landmarks.bin: all cached faces as one flat int16 array of shape (n, 468, 2), read through a memory map
+      index.json:    {image digest: [first face row, number of faces]}
+    Images without a face are cached too (with 0 faces), so they are not run through the mesh again.
+    A configuration with random augmentation is never cached: the keypoints of a file would be those of one
+    frozen random sample, every lookup misses and nothing is stored.
+    """
+
+    def __init__(self, cache_dir, config):
+        self.dir = os.path.join(cache_dir, config_digest(config))
+        os.makedirs(self.dir, exist_ok=True)
+        self.data_path = os.path.join(self.dir, 'landmarks.bin')
+        self.index_path = os.path.join(self.dir, 'index.json')
+        with open(os.path.join(self.dir, 'config.json'), 'w') as f:
+            json.dump(config, f, sort_keys=True)
+
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+
+        # Drop rows written after the last saved index (e.g. after a crash)
+        self.rows = max((start + count for start, count in self.index.values()), default=0)
+        with open(self.data_path, 'ab') as f:
+            f.truncate(self.rows * ROW_BYTES)
+        self.file = open(self.data_path, 'ab')
+        self.data = None
+        self.enabled = not config.get('augment', False)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def _rows_view(self, end):
+        # Re-map the file once rows beyond the current mapping are requested
+        if self.data is None or len(self.data) < end:
+            self.file.flush()
+            self.data = np.memmap(self.data_path, dtype=np.int16, mode='r').reshape(-1, *ROW_SHAPE)
+        return self.data
+
+    def get(self, digest):
+        """Return the cached (n_faces, 468, 2) array for an image digest, or None on a miss"""
+        entry = self.index.get(digest) if self.enabled else None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        start, count = entry
+        if count == 0:
+            return np.empty((0,) + ROW_SHAPE, dtype=np.int16)
+        return np.array(self._rows_view(start + count)[start:start + count])
+
+    def put(self, digest, faces):
+        if not self.enabled:
+            return
+        faces = np.ascontiguousarray(faces, dtype=np.int16).reshape((-1,) + ROW_SHAPE)
+        self.file.write(faces.tobytes())
+        self.index[digest] = [self.rows, len(faces)]
+        self.rows += len(faces)
+
+    def save(self):
+        """Flush the landmark rows, then atomically replace the index"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def close(self):
+        self.save()
+        self.file.close()
+        self.data = None
+
+    def report(self):
+        total = self.hits + self.misses
+        skipped = self.hits / total * 100 if total else 0.0
+        return f"Landmark cache: {self.hits} hits, {self.misses} misses ({skipped:.1f}% of images skipped)"
@@ -2,12 +2,13 @@ import streamlit as st
 import cv2
 import time
 from PIL import Image
-from io import BytesIO
-import base64
-from UI.helper.face_detection import detect_faces, draw_face_boxes
-from UI.helper.emotion_model import predict_emotion
-from UI.helper.utils import convert_frame_to_image
+from UI.helper.face_detection import draw_face_boxes, draw_face_labels
+from UI.helper.emotion_model import predict_emotion, warmup
 from UI.helper.face_mesh import FaceMeshDetector
+from UI.helper.face_tracking import FaceTracker, detect_with_mesh
+from UI.helper.prediction_scheduler import PredictionScheduler
+from UI.helper.live_pipeline import LivePipeline, RateMeter
+from UI.helper.frame_transport import FRAME_TRANSPORT, FrameEncoder, FrameThrottle, get_mjpeg_server
 
 
 
@@ -26,6 +27,43 @@ def display_picture_mode():
         image = Image.open(uploaded_file)
         st.image(image, caption="Uploaded Image", use_column_width=True)
 
+def browser_host():
+    """Host name the browser used to reach this app, so the MJPEG stream URL also works from other machines"""
+    headers = getattr(st, "context", None) and st.context.headers
+    host = headers.get("Host") if headers else None
+    if not host:
+        return None
+    name, _, port = host.rpartition(":")
+    # "name:port", "[::1]:port" or a bare name without a port
+    return name if name and port.isdigit() else host
+
+def analyze_frame(frame, tracker, scheduler):
+    """Track the faces and predict their emotions, runs on the analysis thread and leaves frame untouched"""
+    tracks = tracker.update(frame)
+    labels = []
+    if tracks:
+        # Predict the changed faces in one batch
+        predictions = scheduler.update(frame, tracks)
+        labels = [f"#{track.track_id} {label}" for track, (label, _) in zip(tracks, predictions)]
+    # Copies, the tracker keeps moving its tracks while the frame is rendered
+    return {
+        'boxes': [track.box for track in tracks],
+        'labels': labels,
+        'landmarks': [track.landmarks.copy() for track in tracks if track.landmarks is not None],
+    }
+
+def draw_analysis(frame, result, detector):
+    """Draw the latest analysis on frame, returns the prediction text"""
+    current_label = "No Face Detected"
+    if result is not None and result['boxes']:
+        detector.draw_face_mesh(frame, result['landmarks'])
+        draw_face_boxes(frame, result['boxes'])
+        draw_face_labels(frame, result['boxes'], result['labels'])
+        current_label = ", ".join(result['labels'])
+    # Display the prediction on the video frame
+    cv2.putText(frame, f"Prediction: {current_label}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    return current_label
+
 def run_live_mode():
     # Initialize session state for camera status
     if "camera_active" not in st.session_state:
@@ -76,8 +114,11 @@ def run_live_mode():
     
     result_placeholder = st.empty()
 
-    # Initialize FaceMeshDetector
+    # Initialize FaceMeshDetector, full-frame detection only runs every few frames, the tracker follows the faces
     detector = FaceMeshDetector()
+    tracker = FaceTracker(lambda image: detect_with_mesh(detector, image))
+    # The CNN only runs for faces that changed since their last prediction, the results are smoothed per track
+    scheduler = PredictionScheduler()
 
     # If camera is active
     if st.session_state.camera_active:
@@ -98,69 +139,70 @@ def run_live_mode():
             st.session_state.camera_active = False  # Reset camera state
             return
 
-        # Start the camera loop
+        # Capture and analysis run on their own threads, this loop only renders the newest frame with the
+        # newest analysis, so the display does not wait for inference and old frames are dropped
+        pipeline = LivePipeline(cap, lambda image: analyze_frame(image, tracker, scheduler))
+        # Frames are JPEG-encoded once, straight from BGR, and sent at most at the display rate, either as
+        # st.image bytes or through the local MJPEG stream that the browser pulls without the websocket
+        encoder = FrameEncoder()
+        throttle = FrameThrottle()
+        sent_rate = RateMeter()
+        mjpeg = get_mjpeg_server() if FRAME_TRANSPORT == "mjpeg" else None
         loading_displayed = True
-        while st.session_state.camera_active:
-            ret, frame = cap.read()
-
-            if not ret:
-                # Keep displaying "Loading..." if no frame is captured
-                if not loading_displayed:
+        shown_result, shown_time = None, 0.0
+        with pipeline:  # Stops the threads and releases the camera, also when Streamlit interrupts the script
+            while st.session_state.camera_active:
+                frame, result = pipeline.next_frame()
+
+                if frame is None:
+                    # Keep displaying "Loading..." if no frame is captured
+                    if not loading_displayed:
+                        placeholder.markdown(
+                            '''
+                            <div class="video-container">
+                                <span class="loading-text">Loading...</span>
+                            </div>
+                            ''',
+                            unsafe_allow_html=True,
+                        )
+                        loading_displayed = True
+                    continue
+
+                # Frames beyond the display rate are skipped before any drawing or encoding
+                if not throttle.ready():
+                    continue
+
+                # Successfully captured a frame; remove "Loading..." message
+                if loading_displayed and mjpeg is not None:
                     placeholder.markdown(
-                        '''
+                        f'''
                         <div class="video-container">
-                            <span class="loading-text">Loading...</span>
+                            <img src="{mjpeg.url(browser_host())}" />
                         </div>
                         ''',
                         unsafe_allow_html=True,
                     )
-                    loading_displayed = True
-                time.sleep(0.03)
-                continue
-
-            # Successfully captured a frame; remove "Loading..." message
-            loading_displayed = False
-
-            # Process the frame (FaceMesh and Emotion Detection)
-            frame, faces_mesh, face_detected = detector.find_face_mesh(frame, draw=True)
-            face_boxes = detect_faces(frame)
-            draw_face_boxes(frame, face_boxes)
-
-            current_label = "No Face Detected"
-            
-            if face_detected and face_boxes:
-                x, y, x_end, y_end = face_boxes[0]  # Only analyze the first detected face
-                face_image = convert_frame_to_image(frame, x, y, x_end, y_end)
-                current_label = predict_emotion(face_image)
-
-            result_placeholder.markdown(f"**Result:** `{current_label}`")
-            # Display the prediction on the video frame
-            cv2.putText(frame, f"Prediction: {current_label}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-            # Resize the frame to 720x405 and convert to RGB format
-            frame = cv2.resize(frame, (720, 405))
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-            # Convert the frame to JPEG and encode as Base64
-            pil_img = Image.fromarray(frame)
-            buffered = BytesIO()
-            pil_img.save(buffered, format="JPEG")
-            img_bytes = buffered.getvalue()
-            img_b64 = base64.b64encode(img_bytes).decode()
-
-            # Update the placeholder with the video frame
-            html_code = f'''
-                <div class="video-container">
-                    <img src="data:image/jpeg;base64,{img_b64}" />
-                </div>
-            '''
-            placeholder.markdown(html_code, unsafe_allow_html=True)
-
-            # Add a short delay to reduce CPU usage
-            time.sleep(0.03)
-
-        # Release the camera when stopped
-        cap.release()
+                loading_displayed = False
+
+                # The frame is shared with the analysis thread, draw on a copy
+                frame = frame.copy()
+                current_label = draw_analysis(frame, result, detector)
+
+                # The result line only changes when the label does, the frame rates are refreshed every second
+                if current_label != shown_result or time.perf_counter() - shown_time >= 1:
+                    result_placeholder.markdown(
+                        f"**Result:** `{current_label}`  \n"
+                        f"display {sent_rate.rate:.0f} fps, analysis {pipeline.analysis_rate.rate:.0f} fps, "
+                        f"JPEG {encoder.bytes_per_frame / 1024:.0f} KB/frame, encoded in {encoder.encode_ms:.1f} ms")
+                    shown_result, shown_time = current_label, time.perf_counter()
+
+                # Resize the frame to 720x405 and send it as JPEG
+                jpeg = encoder.encode(cv2.resize(frame, (720, 405)))
+                if mjpeg is not None:
+                    mjpeg.publish(jpeg)
+                else:
+                    placeholder.image(jpeg, width=720)
+                sent_rate.tick()
     else:
         # If camera is not active, clear the placeholder
         placeholder.markdown(
@@ -176,6 +218,9 @@ def run_live_mode():
 def main():
     st.title("FaceMesh and Emotion Recognition")
 
+    # Start loading the emotion model in the background, only the first call per process loads it
+    warmup()
+
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Live Mode"):
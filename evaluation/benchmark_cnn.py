@@ -0,0 +1,145 @@
+import time
+import argparse
+import statistics
+import torch
+from data_processing_method.cnn_datasets import ManifestImageDataset
+from train.cnn_model import LABELS, IMG_SIZE, build_resnet18, build_eval_transform, load_early_exit_cnn
+from UI.helper.emotion_model import EmotionModelManager
+
+
+def time_input_pipeline(in_channels, num_images):
+    """Decode + preprocess throughput of test images, in images per second"""
+    dataset = ManifestImageDataset(split="test", transform=build_eval_transform(in_channels), channels=in_channels)
+    num_images = min(num_images, len(dataset))
+    start = time.perf_counter()
+    for i in range(num_images):
+        dataset[i]
+    return num_images / (time.perf_counter() - start)
+
+
+def time_forward(model, inputs, iters):
+    """Forward throughput of a model on a fixed batch, in images per second"""
+    with torch.no_grad():
+        model(inputs)  # Warm up
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(inputs)
+    return iters * len(inputs) / (time.perf_counter() - start)
+
+
+def conv1_macs(model):
+    conv = model.conv1
+    out_h = (IMG_SIZE[1] + 2 * conv.padding[0] - conv.kernel_size[0]) // conv.stride[0] + 1
+    out_w = (IMG_SIZE[0] + 2 * conv.padding[1] - conv.kernel_size[1]) // conv.stride[1] + 1
+    return conv.weight.numel() * out_h * out_w
+
+
+def benchmark_channels(args):
+    print(f"{'input':<10}{'decode+transform img/s':>24}{'batch bytes':>14}{'conv1 MMACs/img':>18}{'forward img/s':>16}")
+    for in_channels, name in [(3, "RGB"), (1, "grayscale")]:
+        model = build_resnet18(len(LABELS), in_channels=in_channels).eval()
+        inputs = torch.randn(args.batch_size, in_channels, *IMG_SIZE)
+        pipeline_rate = time_input_pipeline(in_channels, args.images)
+        forward_rate = time_forward(model, inputs, args.iters)
+        print(f"{name:<10}{pipeline_rate:>24.0f}{inputs.numel() * inputs.element_size():>14}"
+              f"{conv1_macs(model) / 1e6:>18.2f}{forward_rate:>16.0f}")
+
+
+def evaluate_accuracy(manager, dataset, batch_size):
+    """Accuracy of a model variant on archive/test, predicted from PIL images through the variant's backend"""
+    correct = 0
+    for start in range(0, len(dataset), batch_size):
+        samples = [dataset[i] for i in range(start, min(start + batch_size, len(dataset)))]
+        labels, _ = manager.predict_batch([image for image, _ in samples])
+        correct += sum(label == dataset.classes[label_id] for label, (_, label_id) in zip(labels, samples))
+    return correct / len(dataset) * 100
+
+
+def time_latency(manager, images, runs):
+    """Median time of predict_batch calls on the given images (preprocessing included), in milliseconds"""
+    manager.predict_batch(images)  # Warm up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        manager.predict_batch(images)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def compare_variants(args):
+    dataset = ManifestImageDataset(split="test")
+    batch = [dataset[i][0] for i in range(args.batch_size)]
+    print(f"{'variant':<22}{'accuracy %':>12}{'latency ms (bs=1)':>20}{'img/s (bs=' + str(args.batch_size) + ')':>16}"
+          f"{'load s':>9}")
+    for variant in args.variants:
+        manager = EmotionModelManager(variant).load()
+        accuracy = evaluate_accuracy(manager, dataset, args.batch_size)
+        latency = time_latency(manager, batch[:1], args.runs)
+        throughput = args.batch_size / time_latency(manager, batch, args.iters) * 1000
+        print(f"{variant:<22}{accuracy:>12.2f}{latency:>20.2f}{throughput:>16.0f}{manager.load_seconds:>9.2f}")
+
+
+def benchmark_early_exit(args):
+    """
+    Early exit model on archive/test, one image per call as in the live stream: accuracy, average depth
+    (stages run, 4 is the full ResNet18) and latency saved against always running every stage
+    """
+    model = load_early_exit_cnn(args.in_channels)
+    dataset = ManifestImageDataset(split="test", transform=build_eval_transform(args.in_channels),
+                                   channels=args.in_channels)
+    num_images = min(args.images, len(dataset))
+    samples = [dataset[i] for i in range(num_images)]
+    num_stages = len(model.stages)
+
+    print(f"{'threshold':<11}{'accuracy %':>11}{'avg depth':>11}{'exits per stage %':>26}{'ms / image':>12}"
+          f"{'saved %':>9}")
+    full_ms = None
+    with torch.no_grad():
+        model.predict(samples[0][0].unsqueeze(0))  # Warm up
+        # The baseline (None) runs the final head only, without computing the auxiliary heads
+        for threshold in [None] + sorted(args.thresholds, reverse=True):
+            correct = 0
+            exits = torch.zeros(num_stages, dtype=torch.long)
+            start = time.perf_counter()
+            for image, label_id in samples:
+                if threshold is None:
+                    logits, exit_index = model.forward_final(image.unsqueeze(0)), torch.tensor(num_stages - 1)
+                else:
+                    logits, exit_index = model.predict(image.unsqueeze(0), threshold)
+                correct += int(logits.argmax(dim=1).item() == label_id)
+                exits[exit_index.item()] += 1
+            ms = (time.perf_counter() - start) / num_images * 1000
+            full_ms = full_ms or ms
+            depth = ((torch.arange(num_stages) + 1) * exits).sum().item() / num_images
+            shares = " ".join(f"{share:5.1f}" for share in (exits.float() / num_images * 100).tolist())
+            name = "full" if threshold is None else f"{threshold:.2f}"
+            print(f"{name:<11}{correct / num_images * 100:>11.2f}{depth:>11.2f}{shares:>26}{ms:>12.2f}"
+                  f"{(1 - ms / full_ms) * 100:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CNN input pipeline and inference benchmarks")
+    parser.add_argument("--images", type=int, default=2000,
+                        help="test images for the input pipeline and early exit benchmarks")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--iters", type=int, default=20, help="timed forward passes")
+    parser.add_argument("--runs", type=int, default=100, help="timed single image calls for the latency")
+    parser.add_argument("--variants", nargs="+",
+                        help="compare accuracy on archive/test and latency of emotion model variants "
+                             "(e.g. resnet18 resnet18_int8 resnet18_onnx) instead of benchmarking RGB against grayscale input")
+    parser.add_argument("--early-exit", action="store_true",
+                        help="accuracy, average depth and latency saved of the early exit model per threshold")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.95, 0.9, 0.8, 0.7, 0.6])
+    parser.add_argument("--in-channels", type=int, default=3, choices=[1, 3], help="early exit model input channels")
+    args = parser.parse_args()
+    print(f"torch threads: {torch.get_num_threads()}")
+    if args.early_exit:
+        benchmark_early_exit(args)
+    elif args.variants:
+        compare_variants(args)
+    else:
+        benchmark_channels(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,33 @@
 import os
 import torch
-import torch.nn as nn
 from torch.utils.data import DataLoader
-from torchvision import datasets, transforms, models
 from sklearn.metrics import accuracy_score, f1_score, confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pickle
 import numpy as np
+from data_processing_method.cnn_datasets import ManifestImageDataset
+from train.cnn_model import IMG_SIZE, load_cnn_model, build_eval_transform
 
 # Set device
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 # Define test data path
-TEST_DATA_DIR = "archive/test"
-IMG_SIZE = (48, 48)
+TEST_DATA_ROOT = "archive"
+TEST_SPLIT = "test"
+IN_CHANNELS = 3  # 1 evaluates the grayscale variant
 BATCH_SIZE = 64
 
 # Define data transformations consistent with training
-test_transform = transforms.Compose([
-    transforms.Resize(IMG_SIZE),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-])
+test_transform = build_eval_transform(IN_CHANNELS, IMG_SIZE)
 
 # Load the test dataset
-test_dataset = datasets.ImageFolder(root=TEST_DATA_DIR, transform=test_transform)
+test_dataset = ManifestImageDataset(root=TEST_DATA_ROOT, split=TEST_SPLIT, transform=test_transform,
+                                    channels=IN_CHANNELS)
 test_loader = DataLoader(test_dataset, batch_size=BATCH_SIZE, shuffle=False)
 
-# Get the number of classes
-num_classes = len(test_dataset.classes)
-
-# Load the pretrained model
-model = models.resnet18(pretrained=False)
-model.fc = nn.Linear(model.fc.in_features, num_classes)
-model.load_state_dict(torch.load("ml_model/cnn/cnn_model.pth"))
-model = model.to(device)
-model.eval()  # Set model to evaluation mode
+# Load the trained model (the frozen TorchScript artifact when evaluating on the CPU), in evaluation mode
+model = load_cnn_model(IN_CHANNELS, device)
 
 # Prepare lists to store predictions and labels
 all_preds = []
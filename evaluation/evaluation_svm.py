@@ -1,28 +1,17 @@
 import os
-import pandas as pd
 import numpy as np
 import joblib
 from sklearn.metrics import accuracy_score, f1_score, confusion_matrix
 from sklearn.model_selection import cross_val_score
 import matplotlib.pyplot as plt
 import seaborn as sns
+from helper.feature_store import load_features_or_csv
 
-# Read CSV file using Python engine, skipping bad lines
-data = pd.read_csv('face_keypoints_test.csv', engine='python', on_bad_lines='skip')
-
-# Display basic data info
-print(f'Dataset contains {data.shape[0]} rows and {data.shape[1]} columns')
+# Load the memory-mapped keypoint feature store, fall back to a CSV export if only that exists
+X, y_true, data = load_features_or_csv('features/test', 'face_keypoints_test.csv')
+print(f'Dataset contains {X.shape[0]} rows and {X.shape[1] + 1} columns')
 print(data.head())
 
-# Check for missing values and handle them
-if data.isnull().values.any():
-    print("Missing values detected, handling...")
-    data = data.dropna()  # Or use data.fillna(method='ffill')
-
-# Extract labels and features
-y_true = data['label']
-X = data.drop('label', axis=1).values  # Convert to numpy array
-
 # Load model, label encoder, and scaler
 label_encoder_path = os.path.join('ml_model/svm', 'label_encoder.pkl')
 svm_model_path = os.path.join('ml_model/svm', 'svm_model.pkl')
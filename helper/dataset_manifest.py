@@ -0,0 +1,156 @@
+import os
+import json
+from collections import namedtuple
+from data_processing_method.landmark_cache import file_digest
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
+COLUMNS = ['path', 'label_id', 'split', 'size', 'mtime', 'sha1']
+
+# path is relative to the dataset root in the manifest file, and joined with the root when loaded
+ManifestEntry = namedtuple('ManifestEntry', COLUMNS)
+
+
+class DatasetManifest:
+    """
+    Index of every image below a dataset root laid out as <root>/<split>/<label>/.../<image>.
+    The manifest file also records the mtime and sub folders of every directory, so an update only
+    lists directories whose mtime changed and only stats / hashes the files inside them.
+    """
+
+    def __init__(self, root, labels, entries, dirs):
+        self.root = root
+        self.labels = labels  # Sorted class folder names, label_id indexes this list
+        self.entries = entries
+        self.dirs = dirs
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def splits(self):
+        return sorted({entry.split for entry in self.entries})
+
+    def split(self, name):
+        return [entry for entry in self.entries if entry.split == name]
+
+    def under(self, folder):
+        """Entries whose image lies below folder (a path such as archive/test/surprise)"""
+        prefix = os.path.normpath(folder) + os.sep
+        return [entry for entry in self.entries if entry.path.startswith(prefix)]
+
+    def label(self, entry):
+        return self.labels[entry.label_id]
+
+    def save(self, manifest_path=None):
+        manifest_path = manifest_path or default_manifest_path(self.root)
+        files = [[os.path.relpath(entry.path, self.root)] + list(entry[1:]) for entry in self.entries]
+        data = {'version': 1, 'labels': self.labels, 'columns': COLUMNS, 'files': files, 'dirs': self.dirs}
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, manifest_path)
+
+
+def default_manifest_path(root):
+    # Kept next to the root rather than inside it, writing it must not change the root folder's mtime
+    return os.path.normpath(root) + '.manifest.json'
+
+
+def read_manifest(root='archive', manifest_path=None):
+    """Load the manifest as it is on disk, without looking at the image folders"""
+    manifest_path = manifest_path or default_manifest_path(root)
+    with open(manifest_path) as f:
+        data = json.load(f)
+    entries = [ManifestEntry(os.path.join(root, row[0]), *row[1:]) for row in data['files']]
+    return DatasetManifest(root, data['labels'], entries, data['dirs'])
+
+
+def _scan(root, rel_dir, old_dirs, old_files, dirs, files):
+    path = os.path.join(root, rel_dir) if rel_dir else root
+    mtime = os.stat(path).st_mtime_ns
+    old = old_dirs.get(rel_dir)
+    if old is not None and old['mtime'] == mtime:
+        # Folder content unchanged: keep its files without listing or stat-ing them
+        subdirs = old['subdirs']
+        for rel_path, row in old_files.get(rel_dir, {}).items():
+            files[rel_path] = row
+    else:
+        subdirs = []
+        previous = old_files.get(rel_dir, {})
+        with os.scandir(path) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and rel_dir:
+                    stat = entry.stat()
+                    row = previous.get(rel_path)
+                    if row is None or row['size'] != stat.st_size or row['mtime'] != stat.st_mtime_ns:
+                        row = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': file_digest(entry.path)}
+                    files[rel_path] = row
+    dirs[rel_dir] = {'mtime': mtime, 'subdirs': subdirs}
+    for name in subdirs:
+        _scan(root, os.path.join(rel_dir, name) if rel_dir else name, old_dirs, old_files, dirs, files)
+
+
+def _dirs_unchanged(root, dirs):
+    # One stat per folder instead of one per image
+    for rel_dir, info in dirs.items():
+        path = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            if os.stat(path).st_mtime_ns != info['mtime']:
+                return False
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def update_manifest(root='archive', manifest_path=None, full=False, verbose=True):
+    """
+    Build the manifest, or bring an existing one up to date, and save it if anything changed.
+    Files rewritten in place do not change their folder's mtime, full=True re-stats every file to catch those.
+    """
+    manifest_path = manifest_path or default_manifest_path(root)
+    old_dirs, old_files = {}, {}
+    if os.path.exists(manifest_path):
+        old = read_manifest(root, manifest_path)
+        if not full and _dirs_unchanged(root, old.dirs):
+            return old
+        old_dirs = {} if full else old.dirs
+        for entry in old.entries:
+            rel_path = os.path.relpath(entry.path, root)
+            old_files.setdefault(os.path.dirname(rel_path), {})[rel_path] = {
+                'size': entry.size, 'mtime': entry.mtime, 'sha1': entry.sha1}
+
+    dirs, files = {}, {}
+    _scan(root, '', old_dirs, old_files, dirs, files)
+
+    # Images must lie in <split>/<label>/..., the label folders of every split form the class list
+    rel_paths = [rel_path for rel_path in sorted(files) if len(rel_path.split(os.sep)) >= 3]
+    labels = sorted({rel_path.split(os.sep)[1] for rel_path in rel_paths})
+    label_ids = {label: i for i, label in enumerate(labels)}
+    entries = []
+    for rel_path in rel_paths:
+        split, label = rel_path.split(os.sep)[:2]
+        row = files[rel_path]
+        entries.append(ManifestEntry(os.path.join(root, rel_path), label_ids[label], split,
+                                     row['size'], row['mtime'], row['sha1']))
+
+    manifest = DatasetManifest(root, labels, entries, dirs)
+    if full or dirs != old_dirs:
+        manifest.save(manifest_path)
+        if verbose:
+            known = sum(len(rows) for rows in old_files.values())
+            print(f"Manifest {manifest_path}: {len(entries)} images ({len(entries) - known:+d})")
+    return manifest
+
+
+def load_manifest(root='archive', update=True):
+    """Manifest of a dataset root, refreshed for new or changed folders unless update=False"""
+    if update or not os.path.exists(default_manifest_path(root)):
+        return update_manifest(root, verbose=False)
+    return read_manifest(root)
+
+
+if __name__ == "__main__":
+    update_manifest("archive", full=True)
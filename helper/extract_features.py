@@ -0,0 +1,105 @@
+import os
+import time
+import hashlib
+import argparse
+from data_processing_method.image_processing_pipeline import DetectorPool, EXTRACTION_CONFIG
+from data_processing_method.landmark_cache import LandmarkCache
+from helper.feature_store import FeatureStoreWriter, load_meta, export_csv
+from helper.out_put_csv import extract_with_cache
+from helper.dataset_manifest import load_manifest
+
+
+def list_split(manifest, split):
+    """All images of a split from the dataset manifest, as (path, label, content digest)"""
+    return [(entry.path, manifest.label(entry), entry.sha1) for entry in manifest.split(split)]
+
+
+def paths_digest(image_paths):
+    # Identifies the exact image list a checkpoint cursor refers to
+    return hashlib.sha1("\n".join(path for path, _, _ in image_paths).encode()).hexdigest()
+
+
+def extract_split(split, image_paths, output_store, pool, cache, checkpoint_every=2000, restart=False):
+    """:return: (images processed in this run, images already done by an earlier run)"""
+    digest = paths_digest(image_paths)
+    cursor = 0
+    if not restart and os.path.exists(os.path.join(output_store, 'meta.json')):
+        extra = load_meta(output_store)['extra']
+        if extra.get('paths_digest') != digest:
+            raise SystemExit(f"{output_store} was built from a different image list, rerun with --restart")
+        cursor = extra.get('cursor', 0)
+        if cursor:
+            print(f"[{split}] Resuming at image {cursor}/{len(image_paths)}")
+
+    # Rows are only written at checkpoints, so the row count on disk always matches the saved cursor
+    writer = FeatureStoreWriter(output_store, buffer_rows=None, append=not restart)
+    start, first = time.perf_counter(), cursor
+    no_face = 0
+    while cursor < len(image_paths):
+        chunk = image_paths[cursor:cursor + checkpoint_every]
+        results = extract_with_cache([img_path for img_path, _, _ in chunk], pool, cache,
+                                     [digest for _, _, digest in chunk])
+        for (img_path, label, _), faces in zip(chunk, results):
+            if faces is not None and len(faces) > 0:
+                writer.add(faces[0], label)  # FER images hold one face
+            else:
+                no_face += 1
+        cursor += len(chunk)
+
+        # Checkpoint: landmarks first, then the feature rows together with the cursor they belong to
+        cache.save()
+        writer.flush(cursor=cursor, paths_digest=digest)
+
+        elapsed = time.perf_counter() - start
+        rate = (cursor - first) / elapsed if elapsed > 0 else 0.0
+        eta = (len(image_paths) - cursor) / rate if rate > 0 else 0.0
+        print(f"[{split}] {cursor}/{len(image_paths)} images ({cursor / len(image_paths) * 100:.1f}%), "
+              f"{rate:.1f} images/sec, ETA {eta:.0f}s")
+
+    writer.close(cursor=cursor, paths_digest=digest)
+    elapsed = time.perf_counter() - start
+    print(f"[{split}] Done: {writer.rows} feature rows, {no_face} images without a face, "
+          f"{cursor - first} images processed in {elapsed:.1f}s")
+    return cursor - first, first
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract FaceMesh keypoints for every image of the archive")
+    parser.add_argument("archive", nargs="?", default="archive", help="dataset root holding one folder per split")
+    parser.add_argument("--output", default="features", help="feature stores are written to <output>/<split>")
+    parser.add_argument("--splits", nargs="+", help="splits to process (default: every folder of the archive)")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=16, help="images handed to a worker at a time")
+    parser.add_argument("--checkpoint-every", type=int, default=2000, help="images between two checkpoints")
+    parser.add_argument("--cache-dir", default="cache/landmarks", help="landmark cache directory")
+    parser.add_argument("--restart", action="store_true", help="ignore existing progress and start over")
+    parser.add_argument("--csv", action="store_true", help="also export <output>/<split>.csv")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.archive)
+    splits = args.splits or manifest.splits
+    cache = LandmarkCache(args.cache_dir, EXTRACTION_CONFIG)
+    start = time.perf_counter()
+    processed, resumed = 0, 0
+    with DetectorPool(args.processes, args.chunksize) as pool:
+        print(f"Extracting {', '.join(splits)} with {pool.processes} processes")
+        for split in splits:
+            image_paths = list_split(manifest, split)
+            output_store = os.path.join(args.output, split)
+            split_processed, split_resumed = extract_split(split, image_paths, output_store, pool, cache,
+                                                           args.checkpoint_every, args.restart)
+            if args.csv:
+                export_csv(output_store, output_store + ".csv")
+            processed += split_processed
+            resumed += split_resumed
+    cache.close()
+
+    elapsed = time.perf_counter() - start
+    # Only the images of this run count towards the rate, the ones finished by earlier runs are reported apart
+    print(f"Finished {processed} images in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.1f} images/sec overall, "
+          f"{cache.hits} of them from the landmark cache), {resumed} images already done by an earlier run")
+    print(cache.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+import csv
+import json
+import numpy as np
+
+NUM_FEATURES = 468 * 2  # x, y of every FaceMesh landmark
+
+
+def feature_columns():
+    # Same column names the keypoint CSV files always used
+    return [f'x{i}' for i in range(468)] + [f'y{i}' for i in range(468)]
+
+
+def _read_meta(path):
+    with open(os.path.join(path, 'meta.json')) as f:
+        return json.load(f)
+
+
+class FeatureStoreWriter:
+    """
+    Buffered writer for a keypoint feature store. A store is a directory holding:
+      features.bin: (rows, NUM_FEATURES) matrix, raw int16 (or the dtype given) in row-major order
+      labels.bin:   one uint8 class id per row
+      meta.json:    dtype, row count, class names and any extra state of the producer
+    Rows are kept in memory and written in bulk (every buffer_rows rows, or only on flush() when it is None).
+    meta.json is replaced atomically after every flush, so a store is always readable up to its last flush.
+    """
+
+    def __init__(self, path, dtype='int16', buffer_rows=1024, append=True):
+        self.path = path
+        self.buffer_rows = buffer_rows
+        os.makedirs(path, exist_ok=True)
+        features_path = os.path.join(path, 'features.bin')
+        labels_path = os.path.join(path, 'labels.bin')
+
+        if append and os.path.exists(os.path.join(path, 'meta.json')):
+            self.meta = _read_meta(path)
+            if self.meta['dtype'] != np.dtype(dtype).name:
+                raise ValueError(f"Feature store {path} holds {self.meta['dtype']} rows, not {np.dtype(dtype).name}")
+        else:
+            self.meta = {'dtype': np.dtype(dtype).name, 'num_features': NUM_FEATURES,
+                         'rows': 0, 'classes': [], 'extra': {}}
+        self.dtype = np.dtype(self.meta['dtype'])
+
+        # Drop anything written after the last recorded flush
+        rows = self.meta['rows']
+        self.features_file = open(features_path, 'ab')
+        self.features_file.truncate(rows * NUM_FEATURES * self.dtype.itemsize)
+        self.labels_file = open(labels_path, 'ab')
+        self.labels_file.truncate(rows)
+
+        self.class_ids = {name: i for i, name in enumerate(self.meta['classes'])}
+        self.features = []
+        self.labels = []
+
+    @property
+    def rows(self):
+        return self.meta['rows'] + len(self.features)
+
+    def add(self, features, label):
+        features = np.asarray(features).reshape(-1)
+        if features.size != NUM_FEATURES:
+            raise ValueError(f"Expected {NUM_FEATURES} features, got {features.size}")
+        if label not in self.class_ids:
+            self.class_ids[label] = len(self.meta['classes'])
+            self.meta['classes'].append(label)
+        self.features.append(features.astype(self.dtype, copy=False))
+        self.labels.append(self.class_ids[label])
+        if self.buffer_rows and len(self.features) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self, **extra):
+        """Write buffered rows, then record the new row count (and optional producer state) in meta.json"""
+        if self.features:
+            self.features_file.write(np.stack(self.features).tobytes())
+            self.labels_file.write(np.asarray(self.labels, dtype=np.uint8).tobytes())
+            self.meta['rows'] += len(self.features)
+            self.features, self.labels = [], []
+        for f in (self.features_file, self.labels_file):
+            f.flush()
+            os.fsync(f.fileno())
+        self.meta['extra'].update(extra)
+        tmp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+
+    def close(self, **extra):
+        self.flush(**extra)
+        self.features_file.close()
+        self.labels_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def load_features(path, mmap=True):
+    """
+    Read a feature store.
+    :return: (rows, NUM_FEATURES) feature matrix (memory-mapped unless mmap=False), array of label names
+    """
+    meta = _read_meta(path)
+    rows = meta['rows']
+    shape = (rows, meta['num_features'])
+    features_path = os.path.join(path, 'features.bin')
+    if rows == 0:
+        features = np.empty(shape, dtype=meta['dtype'])
+    elif mmap:
+        features = np.memmap(features_path, dtype=meta['dtype'], mode='r', shape=shape)
+    else:
+        features = np.fromfile(features_path, dtype=meta['dtype'], count=shape[0] * shape[1]).reshape(shape)
+    label_ids = np.fromfile(os.path.join(path, 'labels.bin'), dtype=np.uint8, count=rows)
+    labels = np.asarray(meta['classes'], dtype=object)[label_ids]
+    return features, labels
+
+
+def load_features_or_csv(path, csv_path):
+    """
+    Features and labels of the feature store at path, or of the keypoint CSV export at csv_path if there is
+    no store (read with the python engine, bad lines skipped, rows with missing values dropped).
+    :return: feature matrix, labels, DataFrame starting with the label column and the first keypoint columns
+    """
+    import pandas as pd
+
+    if os.path.isdir(path):
+        features, labels = load_features(path)
+        # Only the first keypoint columns, for data exploration
+        data = pd.DataFrame(features[:, :4], columns=feature_columns()[:4])
+        data.insert(0, 'label', labels)
+        return features, labels, data
+
+    data = pd.read_csv(csv_path, engine='python', on_bad_lines='skip')
+    if data.isnull().values.any():
+        print("Missing values detected, dropping incomplete rows...")
+        data = data.dropna()
+    return data.drop('label', axis=1).values, data['label'], data
+
+
+def load_meta(path):
+    return _read_meta(path)
+
+
+def export_csv(path, output_csv):
+    """Write a feature store out as a keypoint CSV file (label column followed by the keypoints)"""
+    features, labels = load_features(path)
+    with open(output_csv, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['label'] + feature_columns())
+        for start in range(0, len(features), 4096):
+            block = features[start:start + 4096].tolist()
+            writer.writerows([label] + row for label, row in zip(labels[start:start + 4096], block))
+    print(f"Exported {len(features)} rows to {output_csv}")
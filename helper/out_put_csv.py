@@ -1,57 +1,60 @@
-import os
-import cv2
-import csv
-import gc  # Import garbage collection module
-from data_processing_method.image_processing_pipeline import process_image
+import time
+from data_processing_method.image_processing_pipeline import DetectorPool, EXTRACTION_CONFIG
+from data_processing_method.landmark_cache import LandmarkCache, file_digest
+from helper.feature_store import FeatureStoreWriter, export_csv
+from helper.dataset_manifest import load_manifest
 
-import re  # Import regular expression library for removing numbers from folder names
+def process_dataset(dataset_path, output_store, batch_size=100, max_images=1500, cache_dir="cache/landmarks",
+                    output_csv=None):
+    # Keypoints are written to a binary feature store, the CSV file is only an optional export.
+    # The store is rewritten on every run, reruns must not append duplicate rows.
+    writer = FeatureStoreWriter(output_store, append=False)
+    # Images and labels come from the dataset manifest instead of walking the folders
+    manifest = load_manifest()
+    image_paths = [(entry.path, manifest.label(entry), entry.sha1) for entry in manifest.under(dataset_path)]
+    image_paths = image_paths[:max_images]  # Stop after reaching the maximum number of images
 
-def create_csv_if_not_exists(output_csv):
-    if not os.path.exists(output_csv):
-        with open(output_csv, 'w', newline='') as file:
-            writer = csv.writer(file)
-            # Create headers: the first is the label, the rest are keypoint coordinates (468 keypoints, each with 2 coordinates x, y)
-            header = ['label'] + [f'x{i}' for i in range(468)] + [f'y{i}' for i in range(468)]
-            writer.writerow(header)
+    # Process images in batches, reusing the same detector processes for every batch
+    cache = LandmarkCache(cache_dir, EXTRACTION_CONFIG)
+    start = time.perf_counter()
+    with DetectorPool() as pool:
+        for i in range(0, min(len(image_paths), max_images), batch_size):
+            batch = image_paths[i:i + batch_size]
+            process_batch(batch, writer, pool, cache)
+            cache.save()
+    cache.close()
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(image_paths)} images in {elapsed:.1f}s ({len(image_paths) / max(elapsed, 1e-9):.1f} images/sec)")
+    print(cache.report())
+    if output_csv:
+        export_csv(output_store, output_csv)
 
-def save_keypoints_to_csv(faces, label, output_csv):
-    flat_keypoints = [coord for face in faces for point in face for coord in point]
-    data_row = [label] + flat_keypoints
-    with open(output_csv, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(data_row)
+def extract_with_cache(img_paths, pool, cache, digests=None):
+    """Keypoints for every path, only images missing from the cache are run through the mesh"""
+    if digests is None:
+        digests = [file_digest(img_path) for img_path in img_paths]
+    results = [cache.get(digest) for digest in digests]
+    missing = [i for i, faces in enumerate(results) if faces is None]
+    for i, faces in zip(missing, pool.imap([img_paths[i] for i in missing])):
+        results[i] = faces
+        if faces is not None:  # Unreadable images are not cached
+            cache.put(digests[i], faces)
+    return results
 
-def process_dataset(dataset_path, output_csv, batch_size=100, max_images=1500):
-    create_csv_if_not_exists(output_csv)
-    image_paths = []
-    for root, dirs, files in os.walk(dataset_path):
-        for file in files:
-            if file.endswith(".jpg"):
-                label = os.path.basename(root)  # Folder name is the label
-                label = re.sub(r'\d+$', '', label)  # Remove trailing numbers from label using regular expression
-                img_path = os.path.join(root, file)  # Construct the full path of the image
-                image_paths.append((img_path, label))
-                if len(image_paths) >= max_images:  # Stop after reaching the maximum number of images
-                    break
-        if len(image_paths) >= max_images:  # Ensure to stop collecting paths after exceeding the maximum number of images
-            break
-
-    # Process images in batches
-    for i in range(0, min(len(image_paths), max_images), batch_size):
-        batch = image_paths[i:i + batch_size]
-        process_batch(batch, output_csv)
-        gc.collect()  # Release memory after processing each batch
-
-def process_batch(batch, output_csv):
-    for img_path, label in batch:
-        img, faces = process_image(img_path)  # Process image and extract keypoints
-        if faces:
-            save_keypoints_to_csv(faces, label, output_csv)
+def process_batch(batch, writer, pool, cache):
+    # Extract keypoints for the whole batch at once with the detector pool
+    results = extract_with_cache([img_path for img_path, _, _ in batch], pool, cache,
+                                 [digest for _, _, digest in batch])
+    for (img_path, label, _), faces in zip(batch, results):
+        if faces is not None and len(faces) > 0:
+            writer.add(faces[0], label)  # FER images hold one face
             print(f"Processed: {img_path}, Number of face keypoints: {len(faces)}")
         else:
             print(f"No face detected: {img_path}")
 
 if __name__ == "__main__":
     dataset_path = "archive/test/surprise/surprise1"
-    output_csv = "face_keypoints_test1.csv"
-    process_dataset(dataset_path, output_csv, batch_size=5, max_images=1500)  # Process 1500 images at a time
+    # A store of its own: features/test belongs to helper.extract_features (cursor and paths_digest)
+    output_store = "features/surprise_sample"
+    process_dataset(dataset_path, output_store, batch_size=5, max_images=1500)  # Process 1500 images at a time
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import cv2
+import numpy as np
+from helper.dataset_manifest import load_manifest
+
+PACKED_DIR = "archive_packed"
+IMG_SIZE = (48, 48)
+
+
+def split_digest(entries):
+    # Identifies the exact images (and their order) a packed split was built from
+    return hashlib.sha1("\n".join(f"{entry.sha1} {entry.label_id}" for entry in entries).encode()).hexdigest()
+
+
+def packed_paths(packed_dir, split):
+    return (os.path.join(packed_dir, f"{split}_images.npy"),
+            os.path.join(packed_dir, f"{split}_labels.npy"),
+            os.path.join(packed_dir, f"{split}_meta.json"))
+
+
+def pack_split(manifest, split, packed_dir=PACKED_DIR, img_size=IMG_SIZE):
+    """Decode every image of a split once into an (N, H, W) uint8 .npy file plus an int64 label .npy file"""
+    entries = manifest.split(split)
+    images_path, labels_path, meta_path = packed_paths(packed_dir, split)
+    os.makedirs(packed_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    images = np.lib.format.open_memmap(images_path + ".tmp", mode='w+', dtype=np.uint8,
+                                       shape=(len(entries), img_size[1], img_size[0]))
+    for i, entry in enumerate(entries):
+        img = cv2.imread(entry.path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"Unable to load image: {entry.path}")
+        if img.shape != images.shape[1:]:
+            img = cv2.resize(img, img_size, interpolation=cv2.INTER_AREA)
+        images[i] = img
+    images.flush()
+    del images
+    labels = np.array([entry.label_id for entry in entries], dtype=np.int64)
+
+    # Move the finished files into place, the meta file last so a half written pack is never used
+    np.save(labels_path, labels)
+    os.replace(images_path + ".tmp", images_path)
+    with open(meta_path, 'w') as f:
+        json.dump({'classes': manifest.labels, 'count': len(entries), 'img_size': list(img_size),
+                   'digest': split_digest(entries)}, f)
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(images_path) / 1e6
+    print(f"Packed {split}: {len(entries)} images ({size_mb:.1f} MB) in {elapsed:.1f}s -> {images_path}")
+
+
+def is_packed(manifest, split, packed_dir=PACKED_DIR, img_size=IMG_SIZE):
+    """True if the packed split exists and matches the current manifest and image size"""
+    meta_path = packed_paths(packed_dir, split)[2]
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta['img_size'] == list(img_size) and meta['digest'] == split_digest(manifest.split(split))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the archive into memory-mappable uint8 arrays for CNN training")
+    parser.add_argument("archive", nargs="?", default="archive", help="dataset root")
+    parser.add_argument("--output", default=PACKED_DIR, help="folder for the packed .npy files")
+    parser.add_argument("--splits", nargs="+", help="splits to pack (default: all)")
+    parser.add_argument("--force", action="store_true", help="repack even if the packed split is up to date")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.archive)
+    for split in args.splits or manifest.splits:
+        if not args.force and is_packed(manifest, split, args.output):
+            print(f"{split} is up to date")
+            continue
+        pack_split(manifest, split, args.output)
+
+
+if __name__ == "__main__":
+    main()
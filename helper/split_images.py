@@ -1,5 +1,6 @@
 import os
 import shutil
+from helper.dataset_manifest import update_manifest
 
 def split_images_into_folders(source_folder, destination_folder, images_per_folder):
     # Get all image files
@@ -34,3 +35,6 @@ if __name__ == "__main__":
     images_per_folder = 1500  # Number of images per folder
     
     split_images_into_folders(source_folder, destination_folder, images_per_folder)
+
+    # Moved images get new paths, refresh the manifest (only the changed folders are rescanned)
+    update_manifest('archive')
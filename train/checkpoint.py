@@ -0,0 +1,77 @@
+import os
+import queue
+import threading
+import torch
+
+
+def cpu_snapshot(state):
+    """Copy of a nested state with every tensor cloned to the CPU, so training can go on changing the original"""
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    if isinstance(state, dict):
+        return {key: cpu_snapshot(value) for key, value in state.items()}
+    if isinstance(state, (list, tuple)):
+        return type(state)(cpu_snapshot(value) for value in state)
+    return state
+
+
+def atomic_save(state, path):
+    """torch.save to a temporary file that is flushed to disk and then renamed over path"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    # Checkpoints hold RNG states (numpy, python) besides tensors, so they are not weights-only files
+    return torch.load(path, map_location="cpu", weights_only=False)
+
+
+class AsyncCheckpointer:
+    """
+    Writes checkpoints from a background thread, so the training loop only pays for the CPU snapshot.
+    At most one write is queued behind the one in progress; save() blocks beyond that instead of piling
+    up snapshots in memory. A failed write is raised by the next save() or by close().
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            state, path = item
+            try:
+                atomic_save(state, path)
+            except Exception as e:
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing a checkpoint failed") from error
+
+    def save(self, state, path):
+        self._raise_error()
+        self._queue.put((cpu_snapshot(state), path))
+
+    def close(self):
+        """Wait for the pending writes"""
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
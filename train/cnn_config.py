@@ -0,0 +1,46 @@
+import os
+
+# Kept free of torch imports, so inference backends that do not need torch can use these settings
+
+# Label list, in the order of the class folders
+LABELS = ["angry", "disgust", "fear", "happy", "neutral", "sad", "surprise"]
+IMG_SIZE = (48, 48)
+
+# Weights of every CNN variant, relative to the repository root
+MODEL_DIR = "ml_model/cnn"
+CNN_MODEL_PATHS = {
+    3: os.path.join(MODEL_DIR, "cnn_model.pth"),       # RGB input
+    1: os.path.join(MODEL_DIR, "cnn_model_gray.pth"),  # Single channel grayscale input
+}
+# ResNet18 with auxiliary exit heads after the intermediate stages, trained by train_cnn_model.py with EARLY_EXIT
+EARLY_EXIT_MODEL_PATHS = {
+    3: os.path.join(MODEL_DIR, "cnn_model_early_exit.pth"),
+    1: os.path.join(MODEL_DIR, "cnn_model_gray_early_exit.pth"),
+}
+# An early exit model stops at the first head whose top class probability reaches this threshold
+EXIT_THRESHOLD = 0.8
+# Compact student CNNs distilled from ResNet18 by train/distill_cnn_model.py
+STUDENT_MODEL_PATHS = {
+    3: os.path.join(MODEL_DIR, "cnn_student.pth"),
+    1: os.path.join(MODEL_DIR, "cnn_student_gray.pth"),
+}
+# Traced and frozen (BN folded into conv) TorchScript models, built by train/freeze_cnn_model.py
+SCRIPTED_MODEL_PATHS = {
+    3: os.path.join(MODEL_DIR, "cnn_model_frozen.pt"),
+    1: os.path.join(MODEL_DIR, "cnn_model_gray_frozen.pt"),
+}
+# Static INT8 quantized TorchScript models, built by train/quantize_cnn_model.py
+QUANTIZED_MODEL_PATHS = {
+    3: os.path.join(MODEL_DIR, "cnn_model_int8.pt"),
+    1: os.path.join(MODEL_DIR, "cnn_model_gray_int8.pt"),
+}
+# Quantized kernels used to calibrate and to run the INT8 models
+QUANTIZATION_ENGINE = "x86"  # fbgemm based kernels for x86 CPUs, use "qnnpack" on ARM
+# ONNX graphs with a dynamic batch dimension, built by train/export_onnx_model.py
+ONNX_MODEL_PATHS = {
+    3: os.path.join(MODEL_DIR, "cnn_model.onnx"),
+    1: os.path.join(MODEL_DIR, "cnn_model_gray.onnx"),
+}
+# Normalization of the [0, 1] input, the same for every channel
+NORMALIZE_MEAN = 0.5
+NORMALIZE_STD = 0.5
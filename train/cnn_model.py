@@ -0,0 +1,227 @@
+import os
+import torch
+import torch.nn as nn
+from torchvision import models, transforms
+from torchvision.models import quantization as quantizable_models
+from train.cnn_config import (LABELS, IMG_SIZE, CNN_MODEL_PATHS, EARLY_EXIT_MODEL_PATHS, EXIT_THRESHOLD,
+                              STUDENT_MODEL_PATHS, SCRIPTED_MODEL_PATHS, NORMALIZE_MEAN, NORMALIZE_STD)
+
+# Loss weight of each exit head (after layer1, layer2, layer3 and the final classifier) in joint training
+EXIT_LOSS_WEIGHTS = (0.3, 0.3, 0.3, 1.0)
+
+
+def build_resnet18(num_classes=len(LABELS), in_channels=3, pretrained=False):
+    """
+    ResNet18 with its last layer sized to num_classes.
+    With in_channels=1 conv1 takes grayscale input, its filters are the pretrained RGB filters summed over
+    the color channels, which gives the same response for a gray image replicated into 3 channels.
+    """
+    model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None)
+    return _adapt_resnet18(model, num_classes, in_channels)
+
+
+def build_quantizable_resnet18(num_classes=len(LABELS), in_channels=3):
+    """
+    Same network as build_resnet18 (its state_dict loads as is), with the quant / dequant stubs and
+    fusable blocks eager mode static quantization needs
+    """
+    model = quantizable_models.resnet18(weights=None, quantize=False)
+    return _adapt_resnet18(model, num_classes, in_channels)
+
+
+def _adapt_resnet18(model, num_classes, in_channels):
+    if in_channels != 3:
+        rgb_conv = model.conv1
+        model.conv1 = nn.Conv2d(in_channels, rgb_conv.out_channels, kernel_size=rgb_conv.kernel_size,
+                                stride=rgb_conv.stride, padding=rgb_conv.padding, bias=False)
+        with torch.no_grad():
+            model.conv1.weight.copy_(rgb_conv.weight.sum(dim=1, keepdim=True).repeat(1, in_channels, 1, 1))
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    return model
+
+
+class EarlyExitResNet18(nn.Module):
+    """
+    ResNet18 with an auxiliary classifier (global average pooling + linear) after layer1, layer2 and layer3
+    in addition to the final one. forward() returns the logits of every head, for joint training;
+    predict() runs each image only as deep as needed, stopping at the first confident head.
+    """
+
+    def __init__(self, num_classes=len(LABELS), in_channels=3, pretrained=False):
+        super().__init__()
+        resnet = build_resnet18(num_classes, in_channels=in_channels, pretrained=pretrained)
+        self.num_classes = num_classes
+        self.stem = nn.Sequential(resnet.conv1, resnet.bn1, resnet.relu, resnet.maxpool)
+        self.stages = nn.ModuleList([resnet.layer1, resnet.layer2, resnet.layer3, resnet.layer4])
+        self.heads = nn.ModuleList([self._exit_head(stage[-1].bn2.num_features, num_classes)
+                                    for stage in self.stages[:-1]])
+        self.heads.append(nn.Sequential(resnet.avgpool, nn.Flatten(), resnet.fc))
+
+    @staticmethod
+    def _exit_head(in_features, num_classes):
+        return nn.Sequential(nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(in_features, num_classes))
+
+    def forward(self, x):
+        x = self.stem(x)
+        outputs = []
+        for stage, head in zip(self.stages, self.heads):
+            x = stage(x)
+            outputs.append(head(x))
+        return outputs
+
+    def predict(self, x, threshold=EXIT_THRESHOLD):
+        """
+        Early exit inference: each image leaves at the first head whose top softmax probability reaches
+        threshold, only the remaining images go through the next stage.
+        :return: logits (n, num_classes), index of the head each image exited at (n,)
+        """
+        logits = x.new_empty(len(x), self.num_classes)
+        exits = torch.empty(len(x), dtype=torch.long, device=x.device)
+        remaining = torch.arange(len(x), device=x.device)
+        x = self.stem(x)
+        last = len(self.stages) - 1
+        for depth, (stage, head) in enumerate(zip(self.stages, self.heads)):
+            x = stage(x)
+            output = head(x)
+            done = None if depth == last else torch.softmax(output, dim=1).max(dim=1).values >= threshold
+            if done is None or done.all():
+                logits[remaining] = output
+                exits[remaining] = depth
+                break
+            # Gather only when some images exit here, most single image calls skip the indexing entirely
+            if done.any():
+                logits[remaining[done]] = output[done]
+                exits[remaining[done]] = depth
+                remaining, x = remaining[~done], x[~done]
+        return logits, exits
+
+    def forward_final(self, x):
+        """Logits of the final head only, the plain ResNet18 computation"""
+        x = self.stem(x)
+        for stage in self.stages:
+            x = stage(x)
+        return self.heads[-1](x)
+
+
+def early_exit_loss(outputs, labels, criterion, weights=EXIT_LOSS_WEIGHTS):
+    """Weighted sum of the losses of every exit head"""
+    return sum(weight * criterion(output, labels) for weight, output in zip(weights, outputs))
+
+
+def build_early_exit_resnet18(num_classes=len(LABELS), in_channels=3, pretrained=False):
+    return EarlyExitResNet18(num_classes, in_channels=in_channels, pretrained=pretrained)
+
+
+def load_early_exit_cnn(in_channels=3, device="cpu", root_dir="."):
+    """Trained early exit ResNet18 in eval mode"""
+    model = build_early_exit_resnet18(len(LABELS), in_channels=in_channels)
+    model_path = os.path.join(root_dir, EARLY_EXIT_MODEL_PATHS[in_channels])
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    return model.to(device).eval()
+
+
+class StudentCNN(nn.Module):
+    """
+    Compact CNN sized for 48x48 face crops, distilled from ResNet18 for real-time inference.
+    A stride 2 stem conv (48 -> 24), then three stages of two 3x3 conv-bn-relu layers with max pooling
+    between them (24 -> 12 -> 6), global average pooling and a linear classifier.
+    About 300k parameters and 27M MACs per face, against 11M parameters and 98M MACs for ResNet18 at 48x48.
+    """
+
+    def __init__(self, num_classes=len(LABELS), in_channels=3, widths=(32, 64, 128), dropout=0.3):
+        super().__init__()
+        layers = self._conv_bn_relu(in_channels, widths[0], stride=2)
+        in_channels = widths[0]
+        for i, width in enumerate(widths):
+            if i > 0:
+                layers.append(nn.MaxPool2d(2))
+            layers += self._conv_bn_relu(in_channels, width) + self._conv_bn_relu(width, width)
+            in_channels = width
+        self.features = nn.Sequential(*layers)
+        self.pool = nn.AdaptiveAvgPool2d(1)
+        self.dropout = nn.Dropout(dropout)
+        self.fc = nn.Linear(widths[-1], num_classes)
+
+    @staticmethod
+    def _conv_bn_relu(in_channels, out_channels, stride=1):
+        return [
+            nn.Conv2d(in_channels, out_channels, kernel_size=3, stride=stride, padding=1, bias=False),
+            nn.BatchNorm2d(out_channels),
+            nn.ReLU(inplace=True),
+        ]
+
+    def forward(self, x):
+        x = self.pool(self.features(x)).flatten(1)
+        return self.fc(self.dropout(x))
+
+
+def build_student_cnn(num_classes=len(LABELS), in_channels=3):
+    return StudentCNN(num_classes, in_channels=in_channels)
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def load_student_cnn(in_channels=3, device="cpu", root_dir="."):
+    """Trained student CNN in eval mode"""
+    model = build_student_cnn(len(LABELS), in_channels=in_channels)
+    model.load_state_dict(torch.load(os.path.join(root_dir, STUDENT_MODEL_PATHS[in_channels]), map_location=device))
+    return model.to(device).eval()
+
+
+def load_cnn_model(in_channels=3, device="cpu", root_dir="."):
+    """
+    Trained fp32 CNN in eval mode. On the CPU the frozen TorchScript artifact is loaded directly when it is
+    newer than the weights, or when only the frozen artifact is deployed, which skips building the network
+    in Python; otherwise ResNet18 is rebuilt and the state_dict loaded. The frozen graph is specialized for
+    the CPU, so GPUs always use the rebuilt model.
+    """
+    device = torch.device(device)
+    weights_path = os.path.join(root_dir, CNN_MODEL_PATHS[in_channels])
+    scripted_path = os.path.join(root_dir, SCRIPTED_MODEL_PATHS[in_channels])
+    if device.type == "cpu" and os.path.exists(scripted_path) and (
+            not os.path.exists(weights_path) or os.path.getmtime(scripted_path) >= os.path.getmtime(weights_path)):
+        return torch.jit.load(scripted_path, map_location=device)
+    model = build_resnet18(len(LABELS), in_channels=in_channels)
+    model.load_state_dict(torch.load(weights_path, map_location=device))
+    return model.to(device).eval()
+
+
+def normalize_transform(in_channels=3):
+    return transforms.Normalize(mean=[NORMALIZE_MEAN] * in_channels, std=[NORMALIZE_STD] * in_channels)
+
+
+def build_eval_transform(in_channels=3, img_size=IMG_SIZE):
+    """Deterministic preprocessing of a PIL image for evaluation and inference"""
+    steps = [transforms.Grayscale(num_output_channels=1)] if in_channels == 1 else []
+    return transforms.Compose(steps + [
+        transforms.Resize(img_size),
+        transforms.ToTensor(),
+        normalize_transform(in_channels)
+    ])
+
+
+def build_augmentation(img_size=IMG_SIZE):
+    return [
+        transforms.RandomHorizontalFlip(),
+        transforms.RandomRotation(10),
+        transforms.RandomResizedCrop(img_size, scale=(0.8, 1.0)),
+        transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
+    ]
+
+
+def build_uint8_transform(img_size=IMG_SIZE):
+    """Resize a PIL image to a uint8 tensor, for batches augmented and normalized later by BatchAugmenter"""
+    return transforms.Compose([transforms.Resize(img_size), transforms.PILToTensor()])
+
+
+def build_train_transform(in_channels=3, img_size=IMG_SIZE, packed=False):
+    """
+    Augmentation + preprocessing for training. The packed dataset already yields [0, 1] tensors of
+    img_size, so with packed=True only the tensor transforms apply.
+    """
+    if packed:
+        return transforms.Compose(build_augmentation(img_size) + [normalize_transform(in_channels)])
+    return transforms.Compose([transforms.Resize(img_size)] + build_augmentation(img_size) +
+                              [transforms.ToTensor(), normalize_transform(in_channels)])
@@ -0,0 +1,142 @@
+import time
+import pickle
+import argparse
+import statistics
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.utils.data import DataLoader
+from helper.dataset_manifest import load_manifest
+from data_processing_method.cnn_datasets import load_split
+from train.cnn_model import (LABELS, IMG_SIZE, STUDENT_MODEL_PATHS, build_resnet18, build_student_cnn,
+                             load_cnn_model, count_parameters)
+
+# Define data paths and hyperparameters
+DATA_ROOT = "archive"
+TRAIN_SPLIT = "train"
+VAL_SPLIT = "test"
+BATCH_SIZE = 64
+EPOCHS = 30
+LEARNING_RATE = 0.001
+PATIENCE = 10  # Tolerance for early stopping
+TEMPERATURE = 4.0  # Softens the teacher's logits so the student also learns the relative class scores
+ALPHA = 0.7  # Weight of the soft teacher loss, the hard label loss gets 1 - ALPHA
+
+
+def distillation_loss(student_logits, teacher_logits, labels, temperature=TEMPERATURE, alpha=ALPHA):
+    """KL divergence to the temperature softened teacher distribution plus cross entropy on the labels"""
+    soft = F.kl_div(F.log_softmax(student_logits / temperature, dim=1),
+                    F.softmax(teacher_logits / temperature, dim=1), reduction="batchmean")
+    hard = F.cross_entropy(student_logits, labels)
+    # Scaled by T^2 so the soft gradients keep their magnitude when the temperature changes
+    return alpha * soft * temperature ** 2 + (1 - alpha) * hard
+
+
+def evaluate(model, loader, device):
+    """Accuracy in percent"""
+    model.eval()
+    correct = 0
+    with torch.no_grad():
+        for images, labels in loader:
+            images, labels = images.to(device), labels.to(device)
+            correct += (model(images).argmax(dim=1) == labels).sum().item()
+    return correct / len(loader.dataset) * 100
+
+
+def frame_latency(model, in_channels, runs=100):
+    """Median CPU time of one single-face forward pass, in milliseconds"""
+    model = model.cpu().eval()
+    image = torch.zeros(1, in_channels, *IMG_SIZE)
+    timings = []
+    with torch.no_grad():
+        model(image)  # Warm up
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(image)
+            timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def distill(in_channels=3, epochs=EPOCHS, temperature=TEMPERATURE, alpha=ALPHA, batch_size=BATCH_SIZE,
+            learning_rate=LEARNING_RATE, train_split=TRAIN_SPLIT, val_split=VAL_SPLIT):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    manifest = load_manifest(DATA_ROOT)
+    train_loader = DataLoader(load_split(train_split, train=True, in_channels=in_channels, manifest=manifest),
+                              batch_size=batch_size, shuffle=True)
+    val_loader = DataLoader(load_split(val_split, train=False, in_channels=in_channels, manifest=manifest),
+                            batch_size=batch_size, shuffle=False)
+
+    # The teacher is the trained ResNet18, only ever run in inference mode
+    teacher = load_cnn_model(in_channels, device)
+    teacher_accuracy = evaluate(teacher, val_loader, device)
+    print(f"Teacher validation accuracy: {teacher_accuracy:.2f}%")
+
+    student = build_student_cnn(len(LABELS), in_channels=in_channels).to(device)
+    optimizer = optim.AdamW(student.parameters(), lr=learning_rate)
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
+
+    history = {'train_loss': [], 'val_accuracy': []}
+    best_accuracy = 0.0
+    epochs_no_improve = 0
+    for epoch in range(epochs):
+        student.train()
+        running_loss = 0.0
+        for images, labels in train_loader:
+            images, labels = images.to(device), labels.to(device)
+            with torch.no_grad():
+                teacher_logits = teacher(images)
+
+            optimizer.zero_grad()
+            loss = distillation_loss(student(images), teacher_logits, labels, temperature, alpha)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * images.size(0)
+
+        train_loss = running_loss / len(train_loader.dataset)
+        val_accuracy = evaluate(student, val_loader, device)
+        history['train_loss'].append(train_loss)
+        history['val_accuracy'].append(val_accuracy)
+        print(f"Epoch [{epoch+1}/{epochs}], Distillation Loss: {train_loss:.4f}, Val Accuracy: {val_accuracy:.2f}%")
+        scheduler.step()
+
+        if val_accuracy > best_accuracy:
+            best_accuracy = val_accuracy
+            epochs_no_improve = 0
+            torch.save(student.state_dict(), STUDENT_MODEL_PATHS[in_channels])
+            print("Best student saved")
+        else:
+            epochs_no_improve += 1
+        if epochs_no_improve >= PATIENCE:
+            print("Early stopping triggered due to no improvement in validation accuracy")
+            break
+
+    with open("ml_model/cnn/student_training_history.pkl", "wb") as f:
+        pickle.dump(history, f)
+
+    # Teacher and the best student side by side
+    student.load_state_dict(torch.load(STUDENT_MODEL_PATHS[in_channels], map_location=device))
+    print(f"{'model':<10}{'parameters':>12}{'val accuracy %':>16}{'CPU ms / face':>15}")
+    # The teacher may be the frozen TorchScript graph, which keeps its weights as constants, not parameters
+    teacher_parameters = count_parameters(build_resnet18(len(LABELS), in_channels=in_channels))
+    for name, model, parameters, accuracy in [("teacher", teacher, teacher_parameters, teacher_accuracy),
+                                              ("student", student, count_parameters(student), best_accuracy)]:
+        print(f"{name:<10}{parameters:>12,}{accuracy:>16.2f}{frame_latency(model, in_channels):>15.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the ResNet18 CNN into a compact student CNN")
+    parser.add_argument("--in-channels", type=int, default=3, choices=[1, 3], help="1 distills the grayscale model")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE)
+    parser.add_argument("--alpha", type=float, default=ALPHA, help="weight of the soft teacher loss")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--learning-rate", type=float, default=LEARNING_RATE)
+    parser.add_argument("--train-split", default=TRAIN_SPLIT)
+    parser.add_argument("--val-split", default=VAL_SPLIT)
+    args = parser.parse_args()
+    distill(args.in_channels, args.epochs, args.temperature, args.alpha, args.batch_size, args.learning_rate,
+            args.train_split, args.val_split)
+
+
+if __name__ == "__main__":
+    main()
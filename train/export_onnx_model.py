@@ -0,0 +1,50 @@
+import argparse
+import numpy as np
+import torch
+from train.cnn_model import LABELS, IMG_SIZE, CNN_MODEL_PATHS, build_resnet18
+from train.cnn_config import ONNX_MODEL_PATHS
+
+ONNX_OPSET = 17
+
+
+def export(in_channels=3, opset=ONNX_OPSET):
+    """Export the fp32 CNN to ONNX, the batch dimension left dynamic so any number of faces fits one call"""
+    model = build_resnet18(len(LABELS), in_channels=in_channels)
+    model.load_state_dict(torch.load(CNN_MODEL_PATHS[in_channels], map_location="cpu"))
+    model.eval()
+
+    # The TorchScript based exporter needs no onnxscript and exports this plain CNN cleanly
+    example = torch.zeros(2, in_channels, *IMG_SIZE)
+    torch.onnx.export(model, example, ONNX_MODEL_PATHS[in_channels], input_names=["image"], output_names=["logits"],
+                      dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}}, opset_version=opset,
+                      dynamo=False)
+    print(f"ONNX model saved to {ONNX_MODEL_PATHS[in_channels]}")
+    verify(model, ONNX_MODEL_PATHS[in_channels], in_channels)
+
+
+def verify(model, onnx_path, in_channels):
+    """Compare onnxruntime and PyTorch outputs on random inputs of a few batch sizes"""
+    try:
+        import onnxruntime
+    except ImportError:
+        print("onnxruntime is not installed, skipping verification")
+        return
+    session = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    for batch_size in (1, 7):
+        inputs = torch.randn(batch_size, in_channels, *IMG_SIZE)
+        with torch.no_grad():
+            expected = model(inputs).numpy()
+        actual = session.run(None, {"image": inputs.numpy()})[0]
+        print(f"batch {batch_size}: max abs difference to PyTorch {np.abs(actual - expected).max():.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the CNN to ONNX for onnxruntime inference")
+    parser.add_argument("--in-channels", type=int, default=3, choices=[1, 3], help="1 exports the grayscale model")
+    parser.add_argument("--opset", type=int, default=ONNX_OPSET)
+    args = parser.parse_args()
+    export(args.in_channels, args.opset)
+
+
+if __name__ == "__main__":
+    main()
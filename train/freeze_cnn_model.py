@@ -0,0 +1,52 @@
+import time
+import argparse
+import torch
+from train.cnn_model import LABELS, IMG_SIZE, CNN_MODEL_PATHS, SCRIPTED_MODEL_PATHS, build_resnet18
+
+
+def freeze(in_channels=3):
+    """Trace the fp32 CNN and freeze its weights into the graph, which folds BN into conv, for CPU inference"""
+    model = build_resnet18(len(LABELS), in_channels=in_channels)
+    model.load_state_dict(torch.load(CNN_MODEL_PATHS[in_channels], map_location="cpu"))
+    model.eval()
+
+    example = torch.zeros(1, in_channels, *IMG_SIZE)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        # freeze inlines the parameters as constants and folds every bn into the conv before it.
+        # optimize_for_inference is not applied: its MKLDNN graph cannot be reloaded once saved, and it was
+        # slower than the frozen graph for the small batches of live inference.
+        frozen = torch.jit.freeze(traced)
+    if "batch_norm" in str(frozen.graph):
+        raise RuntimeError("batch norm was not folded into the convolutions")
+    torch.jit.save(frozen, SCRIPTED_MODEL_PATHS[in_channels])
+    print(f"Frozen TorchScript model saved to {SCRIPTED_MODEL_PATHS[in_channels]}")
+
+    # The traced graph must not depend on the example's batch size, check a different one against eager mode
+    inputs = torch.randn(5, in_channels, *IMG_SIZE)
+    loaded = torch.jit.load(SCRIPTED_MODEL_PATHS[in_channels])
+    with torch.no_grad():
+        difference = (loaded(inputs) - model(inputs)).abs().max().item()
+    print(f"max abs difference to the eager model: {difference:.2e}")
+
+
+def compare_load_times(in_channels=3):
+    start = time.perf_counter()
+    model = build_resnet18(len(LABELS), in_channels=in_channels)
+    model.load_state_dict(torch.load(CNN_MODEL_PATHS[in_channels], map_location="cpu"))
+    eager_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    torch.jit.load(SCRIPTED_MODEL_PATHS[in_channels])
+    print(f"load time: eager {eager_seconds:.3f}s, frozen {time.perf_counter() - start:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the frozen TorchScript CNN used for CPU inference")
+    parser.add_argument("--in-channels", type=int, default=3, choices=[1, 3], help="1 freezes the grayscale model")
+    args = parser.parse_args()
+    freeze(args.in_channels)
+    compare_load_times(args.in_channels)
+
+
+if __name__ == "__main__":
+    main()
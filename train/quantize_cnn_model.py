@@ -0,0 +1,53 @@
+import time
+import argparse
+import torch
+from torch.utils.data import DataLoader, Subset
+from data_processing_method.cnn_datasets import ManifestImageDataset
+from train.cnn_model import LABELS, IMG_SIZE, CNN_MODEL_PATHS, build_quantizable_resnet18, build_eval_transform
+from train.cnn_config import QUANTIZED_MODEL_PATHS, QUANTIZATION_ENGINE
+
+
+def quantize(in_channels=3, calibration_images=1024, batch_size=64, seed=0):
+    """Post-training static INT8 quantization of the fp32 CNN, calibrated on a sample of archive/train"""
+    torch.backends.quantized.engine = QUANTIZATION_ENGINE
+    model = build_quantizable_resnet18(len(LABELS), in_channels=in_channels)
+    model.load_state_dict(torch.load(CNN_MODEL_PATHS[in_channels], map_location="cpu"))
+    model.eval()
+
+    # Fold conv + bn (+ relu) into single modules, then insert observers
+    model.fuse_model(is_qat=False)
+    model.qconfig = torch.ao.quantization.get_default_qconfig(QUANTIZATION_ENGINE)
+    torch.ao.quantization.prepare(model, inplace=True)
+
+    # Calibration: observers record activation ranges on a random sample of training images
+    dataset = ManifestImageDataset(split="train", transform=build_eval_transform(in_channels, IMG_SIZE),
+                                   channels=in_channels)
+    generator = torch.Generator().manual_seed(seed)
+    indices = torch.randperm(len(dataset), generator=generator)[:calibration_images].tolist()
+    loader = DataLoader(Subset(dataset, indices), batch_size=batch_size)
+    start = time.perf_counter()
+    with torch.no_grad():
+        for images, _ in loader:
+            model(images)
+    print(f"Calibrated on {len(indices)} training images in {time.perf_counter() - start:.1f}s")
+
+    torch.ao.quantization.convert(model, inplace=True)
+
+    # Saved as TorchScript so inference does not need to repeat the fuse / prepare / convert steps
+    example = torch.zeros(1, in_channels, *IMG_SIZE)
+    scripted = torch.jit.trace(model, example)
+    torch.jit.save(scripted, QUANTIZED_MODEL_PATHS[in_channels])
+    print(f"INT8 model saved to {QUANTIZED_MODEL_PATHS[in_channels]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static INT8 quantization of the CNN for CPU inference")
+    parser.add_argument("--in-channels", type=int, default=3, choices=[1, 3], help="1 quantizes the grayscale model")
+    parser.add_argument("--calibration-images", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+    quantize(args.in_channels, args.calibration_images, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
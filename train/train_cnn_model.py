@@ -1,143 +1,399 @@
 import os
+import time
+import random
+import argparse
+import pickle
+from contextlib import contextmanager, nullcontext
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
 from torch.utils.data import DataLoader
-from torchvision import datasets, transforms, models
-import pickle
+from torch.utils.data.distributed import DistributedSampler
+from torchvision import transforms
+from helper.dataset_manifest import load_manifest
+from data_processing_method.cnn_datasets import load_split, cached_eval_tensors, TensorBatches, EVAL_CACHE_DIR
+from data_processing_method.batch_augmentation import BatchAugmenter
+from train.checkpoint import AsyncCheckpointer, load_checkpoint
+from train.cnn_model import (LABELS, CNN_MODEL_PATHS, EARLY_EXIT_MODEL_PATHS, build_resnet18,
+                             build_early_exit_resnet18, early_exit_loss, normalize_transform)
 
 # Define data paths and hyperparameters
-DATA_DIR = "archive/test"
-IMG_SIZE = (48, 48)
-BATCH_SIZE = 64
+DATA_ROOT = "archive"
+DATA_SPLIT = "test"
+IN_CHANNELS = 3  # 1 trains the grayscale variant (FER images are grayscale), 3 the RGB one
+BATCH_SIZE = 64  # Global batch size, split evenly over the processes of a distributed run
 EPOCHS = 30
 LEARNING_RATE = 0.001
 PATIENCE = 10  # Tolerance for early stopping
+EARLY_EXIT = False  # True trains ResNet18 jointly with auxiliary exit heads after layer1-3 (early exit inference)
+HISTORY_PATH = "ml_model/training_history.pkl"
+CHECKPOINT_DIR = "ml_model/cnn/checkpoints"  # Full training state after every epoch, for --resume
+
+# Training runtime
+NUM_WORKERS = min(4, os.cpu_count() or 1)  # DataLoader processes decoding and augmenting the next batches
+PREFETCH_FACTOR = 2  # Batches each worker prepares ahead
+CHANNELS_LAST = True  # NHWC memory format, faster convolutions on CPUs (oneDNN) and tensor core GPUs
+BF16 = False  # bfloat16 autocast, for CPUs with native bf16 support (AVX512-BF16 / AMX)
+COMPILE = False  # torch.compile the model, the first epoch pays the compilation
+BATCH_AUGMENT = True  # Augment whole uint8 batches with BatchAugmenter instead of per-image PIL transforms
+VAL_CACHE = True  # Preprocess the validation images once into cached tensors instead of every epoch
+
+
+def compute_loss(outputs, labels, criterion, early_exit):
+    """Loss of a batch and the logits accuracy is measured on (the final head of an early exit model)"""
+    if early_exit:
+        return early_exit_loss(outputs, labels, criterion), outputs[-1]
+    return criterion(outputs, labels), outputs
+
 
-# Build tag list
-LABELS = ["angry", "disgust", "fear", "happy", "neutral", "sad", "surprise"]
-
-# Define data enhancement and preprocessing
-train_transform = transforms.Compose([
-    transforms.Resize(IMG_SIZE),
-    transforms.RandomHorizontalFlip(),
-    transforms.RandomRotation(10),
-    transforms.RandomResizedCrop(IMG_SIZE, scale=(0.8, 1.0)),
-    transforms.ColorJitter(brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-])
-
-val_transform = transforms.Compose([
-    transforms.Resize(IMG_SIZE),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
-])
-
-# Load dataset
-train_dataset = datasets.ImageFolder(root=DATA_DIR, transform=train_transform)
-val_dataset = datasets.ImageFolder(root=DATA_DIR, transform=val_transform)
-
-# data loader
-train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
-
-# Define CNN model (using pretrained ResNet18)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = models.resnet18(pretrained=True)
-model.fc = nn.Linear(model.fc.in_features, len(LABELS))  # Modify the output size of the last layer
-model = model.to(device)
-
-# Define loss function and optimizer
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.AdamW(model.parameters(), lr=LEARNING_RATE)
-scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.1)  # Reduce learning rate every 5 epochs
-
-# Initialize the dictionary that holds training history
-history = {
-    'train_loss': [],
-    'val_loss': [],
-    'train_accuracy': [],
-    'val_accuracy': []
-}
-# Initialize optimal validation accuracy and early stopping counters
-best_accuracy = 0.0
-epochs_no_improve = 0
-
-# training and validation
-for epoch in range(EPOCHS):
-    model.train()
+@contextmanager
+def rank_zero_first(rank, distributed):
+    """
+    Run a block on rank 0 before the other ranks, for steps that write shared files
+    (refreshing the manifest, downloading the pretrained weights)
+    """
+    if distributed and rank != 0:
+        dist.barrier()
+    yield
+    if distributed and rank == 0:
+        dist.barrier()
+
+
+def reduce_sums(values, distributed):
+    """Sum per process statistics over all processes"""
+    if not distributed:
+        return values
+    tensor = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.tolist()
+
+
+def run_epoch(model, loader, criterion, device, early_exit, distributed, optimizer=None, channels_last=CHANNELS_LAST,
+              bf16=BF16, augment=None):
+    """
+    One pass over a loader, training when an optimizer is given. augment, if given, turns each batch
+    into the normalized model input on the device.
+    Returns loss and accuracy over all processes, and this process' seconds spent waiting for batches
+    and computing on them.
+    """
+    model.train(optimizer is not None)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
     running_loss = 0.0
-    correct_train = 0
-    total_train = 0
-    for images, labels in train_loader:
-        images, labels = images.to(device), labels.to(device)
-
-        # forward propagation
-        optimizer.zero_grad()
-        outputs = model(images)
-        loss = criterion(outputs, labels)
-
-        # Backpropagation and optimization
-        loss.backward()
-        optimizer.step()
-
-        # record loss
-        running_loss += loss.item() * images.size(0)
-
-        # Calculate training accuracy
-        _, predicted = torch.max(outputs, 1)
-        correct_train += (predicted == labels).sum().item()
-        total_train += labels.size(0)
-
-    train_loss = running_loss / len(train_loader.dataset)
-    train_accuracy = correct_train / total_train * 100
-    history['train_loss'].append(train_loss)        # Record training loss
-    history['train_accuracy'].append(train_accuracy) # Record training accuracy
-
-    # verify
-    model.eval()
-    val_loss = 0.0
-    correct_val = 0
-    total_val = 0
-    with torch.no_grad():
-        for images, labels in val_loader:
-            images, labels = images.to(device), labels.to(device)
-            outputs = model(images)
-            loss = criterion(outputs, labels)
-            val_loss += loss.item() * images.size(0)
+    correct = 0
+    total = 0
+    data_seconds = 0.0
+    compute_seconds = 0.0
+    with torch.set_grad_enabled(optimizer is not None):
+        batch_start = time.perf_counter()
+        for images, labels in loader:
+            compute_start = time.perf_counter()
+            data_seconds += compute_start - batch_start
+            images = images.to(device, non_blocking=True)
+            labels = labels.to(device, non_blocking=True)
+            if augment is not None:
+                images = augment(images)
+            images = images.contiguous(memory_format=memory_format)
+
+            # forward propagation
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=bf16):
+                loss, outputs = compute_loss(model(images), labels, criterion, early_exit)
+
+            # Backpropagation and optimization
+            if optimizer is not None:
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
 
+            # record loss and accuracy (.item() waits for the device, so the compute time is complete)
+            running_loss += loss.item() * images.size(0)
             _, predicted = torch.max(outputs, 1)
-            correct_val += (predicted == labels).sum().item()
-            total_val += labels.size(0)
-
-    val_loss /= len(val_loader.dataset)
-    val_accuracy = correct_val / total_val * 100
-    history['val_loss'].append(val_loss)          # Record verification loss
-    history['val_accuracy'].append(val_accuracy)  # Record verification accuracy
-
-    print(f"Epoch [{epoch+1}/{EPOCHS}], Train Loss: {train_loss:.4f}, Train Accuracy: {train_accuracy:.2f}%, "
-          f"Val Loss: {val_loss:.4f}, Val Accuracy: {val_accuracy:.2f}%")
-
-    # Learning rate scheduler update
-    scheduler.step()
-
-    # Save the best model
-    if val_accuracy > best_accuracy:
-        best_accuracy = val_accuracy
-        epochs_no_improve = 0
-        torch.save(model.state_dict(), "ml_model/cnn_model.pth")
-        print("Best model saved")
+            correct += (predicted == labels).sum().item()
+            total += labels.size(0)
+            batch_start = time.perf_counter()
+            compute_seconds += batch_start - compute_start
+
+    running_loss, correct, total = reduce_sums([running_loss, correct, total], distributed)
+    total = max(total, 1)  # An empty split reports 0 instead of dividing by zero
+    return running_loss / total, correct / total * 100, data_seconds, compute_seconds
+
+
+def checkpoint_path(model_path):
+    return os.path.join(CHECKPOINT_DIR, os.path.splitext(os.path.basename(model_path))[0] + "_last.ckpt")
+
+
+def rng_state(augmenter):
+    state = {'torch': torch.get_rng_state(), 'numpy': np.random.get_state(), 'python': random.getstate()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    if augmenter is not None:
+        state['augmenter'] = augmenter.rng.bit_generator.state
+    return state
+
+
+def gather_rng_states(augmenter, world_size, distributed):
+    """RNG state of every rank, indexed by rank, every rank must call it"""
+    state = rng_state(augmenter)
+    if not distributed:
+        return [state]
+    states = [None] * world_size
+    dist.all_gather_object(states, state)
+    return states
+
+
+def reseed_rng(epoch, rank, augmenter):
+    # Distinct deterministic streams per rank, for a checkpoint written by a different number of processes
+    seed = epoch * 100003 + rank
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+    if augmenter is not None:
+        augmenter.rng = np.random.default_rng([epoch, rank])
+
+
+def restore_rng_state(state, augmenter):
+    torch.set_rng_state(state['torch'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['python'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    if augmenter is not None and 'augmenter' in state:
+        augmenter.rng.bit_generator.state = state['augmenter']
+
+
+def build_loader(dataset, batch_size, sampler, shuffle, workers, prefetch_factor, device):
+    options = dict(num_workers=workers, pin_memory=device.type == "cuda")
+    if workers > 0:
+        # Persistent workers keep their processes (and memory maps) between epochs
+        options.update(persistent_workers=True, prefetch_factor=prefetch_factor)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle and sampler is None, sampler=sampler,
+                      **options)
+
+
+def train(rank=0, world_size=1, in_channels=IN_CHANNELS, epochs=EPOCHS, batch_size=BATCH_SIZE,
+          early_exit=EARLY_EXIT, workers=NUM_WORKERS, prefetch_factor=PREFETCH_FACTOR, channels_last=CHANNELS_LAST,
+          bf16=BF16, compile_model=COMPILE, batch_augment=BATCH_AUGMENT, val_cache=VAL_CACHE, resume=False):
+    """
+    Train the CNN in this process. With world_size > 1 the process group must already be initialized:
+    every rank trains a DistributedDataParallel replica on its shard of the data, gradients are averaged
+    over gloo, and only rank 0 prints and writes the checkpoints and the history.
+    After every epoch the full training state is checkpointed in the background; resume=True continues
+    from that checkpoint with the epoch after it.
+    """
+    distributed = world_size > 1
+    is_main = rank == 0
+    # gloo runs on the CPU, a single process uses the GPU if there is one
+    device = torch.device("cpu" if distributed or not torch.cuda.is_available() else "cuda")
+
+    # Load dataset: the packed uint8 arrays when they are up to date, otherwise the JPEG files in the manifest
+    with rank_zero_first(rank, distributed):
+        manifest = load_manifest(DATA_ROOT, update=is_main)
+    train_dataset = load_split(DATA_SPLIT, train=True, in_channels=in_channels, manifest=manifest,
+                               batch_augment=batch_augment)
+    if is_main:
+        print(f"Training on {type(train_dataset).__name__} ({DATA_SPLIT} split), {world_size} process(es)")
+
+    # data loader, each process reads its own shard of both splits
+    train_sampler = DistributedSampler(train_dataset, world_size, rank, shuffle=True) if distributed else None
+    process_batch_size = max(1, batch_size // world_size)
+    train_loader = build_loader(train_dataset, process_batch_size, train_sampler, True, workers, prefetch_factor,
+                                device)
+    if val_cache:
+        # Validation is deterministic: preprocess once, then every epoch only runs forward passes
+        with rank_zero_first(rank, distributed):
+            val_images, val_labels = cached_eval_tensors(DATA_SPLIT, in_channels, manifest=manifest)
+        val_loader = TensorBatches(val_images, val_labels, process_batch_size, rank, world_size)
     else:
-        epochs_no_improve += 1
+        val_dataset = load_split(DATA_SPLIT, train=False, in_channels=in_channels, manifest=manifest)
+        val_sampler = DistributedSampler(val_dataset, world_size, rank, shuffle=False) if distributed else None
+        val_loader = build_loader(val_dataset, process_batch_size, val_sampler, False, workers, prefetch_factor,
+                                  device)
+
+    # The batch augmentation engine runs on the device, right before the forward pass
+    augmenter = BatchAugmenter() if batch_augment else None
+    augment = transforms.Compose([augmenter, normalize_transform(in_channels)]) if batch_augment else None
+
+    # Define CNN model (using pretrained ResNet18)
+    with rank_zero_first(rank, distributed):
+        if early_exit:
+            model = build_early_exit_resnet18(len(LABELS), in_channels=in_channels, pretrained=True)
+            model_path = EARLY_EXIT_MODEL_PATHS[in_channels]
+        else:
+            model = build_resnet18(len(LABELS), in_channels=in_channels, pretrained=True)  # Output layer sized to the labels
+            model_path = CNN_MODEL_PATHS[in_channels]
+    base_model = model.to(device, memory_format=torch.channels_last if channels_last else torch.contiguous_format)
+    if distributed:
+        model = DistributedDataParallel(model)  # Broadcasts rank 0's initial weights to every replica
+    if compile_model:
+        model = torch.compile(model)
+
+    # Define loss function and optimizer
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.AdamW(model.parameters(), lr=LEARNING_RATE)
+    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.1)  # Reduce learning rate every 5 epochs
+
+    # Initialize the dictionary that holds training history
+    history = {
+        'train_loss': [],
+        'val_loss': [],
+        'train_accuracy': [],
+        'val_accuracy': []
+    }
+    # Initialize optimal validation accuracy and early stopping counters
+    best_accuracy = 0.0
+    epochs_no_improve = 0
+    start_epoch = 0
+
+    # Continue exactly where the last checkpoint left off
+    last_checkpoint = checkpoint_path(model_path)
+    if resume:
+        if not os.path.exists(last_checkpoint):
+            raise FileNotFoundError(f"No checkpoint to resume from: {last_checkpoint}")
+        state = load_checkpoint(last_checkpoint)
+        if state['settings'] != {'in_channels': in_channels, 'early_exit': early_exit}:
+            raise ValueError(f"Checkpoint was trained with {state['settings']}, not with in_channels={in_channels}, "
+                             f"early_exit={early_exit}")
+        base_model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        scheduler.load_state_dict(state['scheduler'])
+        history = state['history']
+        best_accuracy = state['best_accuracy']
+        epochs_no_improve = state['epochs_no_improve']
+        start_epoch = state['epoch'] + 1
+        # Every rank continues its own random streams (augmentation, shuffling, dropout)
+        if len(state['rng']) == world_size:
+            restore_rng_state(state['rng'][rank], augmenter)
+        else:
+            reseed_rng(start_epoch, rank, augmenter)
+            if is_main:
+                print(f"Checkpoint was written by {len(state['rng'])} process(es), not {world_size}: "
+                      f"random streams reseeded per rank")
+        if is_main:
+            print(f"Resumed from {last_checkpoint} after epoch {start_epoch}, "
+                  f"best validation accuracy so far: {best_accuracy:.2f}%")
+        if epochs_no_improve >= PATIENCE:
+            start_epoch = epochs  # Early stopping had already ended this run
+
+    # training and validation, checkpoints are written by a background thread on rank 0
+    with AsyncCheckpointer() if is_main else nullcontext() as checkpointer:
+        for epoch in range(start_epoch, epochs):
+            if train_sampler is not None:
+                train_sampler.set_epoch(epoch)  # Different shuffle every epoch, the same on all ranks
+            train_loss, train_accuracy, data_seconds, compute_seconds = run_epoch(
+                model, train_loader, criterion, device, early_exit, distributed, optimizer, channels_last, bf16,
+                augment)
+            val_loss, val_accuracy, _, _ = run_epoch(model, val_loader, criterion, device, early_exit, distributed,
+                                                     channels_last=channels_last, bf16=bf16)
+            history['train_loss'].append(train_loss)
+            history['train_accuracy'].append(train_accuracy)
+            history['val_loss'].append(val_loss)
+            history['val_accuracy'].append(val_accuracy)
+
+            if is_main:
+                print(f"Epoch [{epoch+1}/{epochs}], Train Loss: {train_loss:.4f}, "
+                      f"Train Accuracy: {train_accuracy:.2f}%, "
+                      f"Val Loss: {val_loss:.4f}, Val Accuracy: {val_accuracy:.2f}%")
+                # A large data wait share means the workers cannot keep up with the model
+                print(f"  Train time: {data_seconds:.1f}s waiting for data, {compute_seconds:.1f}s computing "
+                      f"({data_seconds / max(data_seconds + compute_seconds, 1e-9) * 100:.0f}% data wait)")
 
-    # Early judgment
-    if epochs_no_improve >= PATIENCE:
-        print("Early stopping triggered due to no improvement in validation accuracy")
-        break
+            # Learning rate scheduler update
+            scheduler.step()
+
+            # Save the best model. The metrics are reduced over all ranks, so every rank takes the same decisions.
+            if val_accuracy > best_accuracy:
+                best_accuracy = val_accuracy
+                epochs_no_improve = 0
+                if is_main:
+                    checkpointer.save(base_model.state_dict(), model_path)
+                    print("Best model saved")
+            else:
+                epochs_no_improve += 1
+
+            # Full training state, everything needed to continue with the next epoch
+            rng_states = gather_rng_states(augmenter, world_size, distributed)
+            if is_main:
+                checkpointer.save({
+                    'epoch': epoch,
+                    'settings': {'in_channels': in_channels, 'early_exit': early_exit},
+                    'model': base_model.state_dict(),
+                    'optimizer': optimizer.state_dict(),
+                    'scheduler': scheduler.state_dict(),
+                    'history': history,
+                    'best_accuracy': best_accuracy,
+                    'epochs_no_improve': epochs_no_improve,
+                    'rng': rng_states,  # One entry per rank
+                }, last_checkpoint)
+
+            # Early judgment
+            if epochs_no_improve >= PATIENCE:
+                if is_main:
+                    print("Early stopping triggered due to no improvement in validation accuracy")
+                break
+
+    # Save training history to file
+    if is_main:
+        with open(HISTORY_PATH, "wb") as f:
+            pickle.dump(history, f)
+        print(f"Training completed. Best validation accuracy: {best_accuracy:.2f}%")
+
+
+def training_options(args):
+    return dict(in_channels=args.in_channels, epochs=args.epochs, batch_size=args.batch_size,
+                early_exit=args.early_exit, workers=args.workers, prefetch_factor=args.prefetch_factor,
+                channels_last=args.channels_last, bf16=args.bf16, compile_model=args.compile,
+                batch_augment=args.batch_augment, val_cache=args.val_cache, resume=args.resume)
+
+
+def run_distributed(rank, world_size, args):
+    """Entry point of one training process, started by mp.spawn or torchrun"""
+    # Share the cores between the processes instead of every process using all of them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // args.local_processes))
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    try:
+        train(rank, world_size, **training_options(args))
+    finally:
+        dist.destroy_process_group()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the ResNet18 CNN, optionally data parallel over processes")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="local training processes (DistributedDataParallel over gloo on the CPU)")
+    parser.add_argument("--in-channels", type=int, default=IN_CHANNELS, choices=[1, 3])
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="global batch size")
+    parser.add_argument("--early-exit", action="store_true", default=EARLY_EXIT,
+                        help="train the early exit variant")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="DataLoader worker processes per process")
+    parser.add_argument("--prefetch-factor", type=int, default=PREFETCH_FACTOR, help="batches prefetched per worker")
+    parser.add_argument("--channels-last", action=argparse.BooleanOptionalAction, default=CHANNELS_LAST,
+                        help="NHWC memory format for the model and the batches")
+    parser.add_argument("--bf16", action="store_true", default=BF16, help="bfloat16 autocast")
+    parser.add_argument("--compile", action="store_true", default=COMPILE, help="torch.compile the model")
+    parser.add_argument("--batch-augment", action=argparse.BooleanOptionalAction, default=BATCH_AUGMENT,
+                        help="augment whole batches on the device (--no-batch-augment: per-image PIL transforms)")
+    parser.add_argument("--val-cache", action=argparse.BooleanOptionalAction, default=VAL_CACHE,
+                        help="validate on preprocessed tensors cached in " + EVAL_CACHE_DIR)
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the last checkpoint in " + CHECKPOINT_DIR)
+    args = parser.parse_args()
+
+    if "WORLD_SIZE" in os.environ:
+        # Launched by torchrun (e.g. over several hosts), which sets the rank and rendezvous variables
+        args.local_processes = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+        run_distributed(int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"]), args)
+    elif args.processes > 1:
+        args.local_processes = args.processes
+        os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+        os.environ.setdefault("MASTER_PORT", "29500")
+        mp.spawn(run_distributed, args=(args.processes, args), nprocs=args.processes)
+    else:
+        train(0, 1, **training_options(args))
 
-# Save training history to file
-with open("ml_model/training_history.pkl", "wb") as f:
-    pickle.dump(history, f)
 
-print(f"Training completed. Best validation accuracy: {best_accuracy:.2f}%")
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,20 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report
 from sklearn.preprocessing import LabelEncoder
 import joblib
+from helper.feature_store import load_features
 
 # Load the dataset and process it, skipping problematic rows
-def load_data(csv_file):
+def load_data(data_path):
+    # Feature stores are memory-mapped directly, CSV files are only read for older exports
+    if not data_path.endswith('.csv'):
+        features, labels = load_features(data_path)
+        label_encoder = LabelEncoder()
+        labels = label_encoder.fit_transform(labels)
+        return features, labels, label_encoder
+
     # Read CSV file using pandas and skip problematic lines
     try:
-        data = pd.read_csv(csv_file, on_bad_lines='skip')
+        data = pd.read_csv(data_path, on_bad_lines='skip')
     except Exception as e:
         print(f"An error occurred while reading the CSV file: {e}")
         return None, None, None
@@ -57,14 +65,14 @@ def train_rf_model(features, labels, model_output_path):
     print(f"Model saved to: {model_output_path}")
 
 if __name__ == "__main__":
-    # CSV file path
-    csv_file = "face_keypoints.csv"
+    # Feature store path (a .csv keypoint file is accepted as well)
+    data_path = "features/train"
     
     # Model save path
     model_output_path = "ml_model/rf_model.pkl"
     
     # Load data
-    features, labels, label_encoder = load_data(csv_file)
+    features, labels, label_encoder = load_data(data_path)
     
     # Training model
     train_rf_model(features, labels, model_output_path)
@@ -4,12 +4,18 @@ from sklearn.svm import SVC
 from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 import joblib
+from helper.feature_store import load_features
 
-def load_data(csv_file):
+def load_data(data_path):
     """
-    Load CSV file and prepare data
+    Load a feature store (or a CSV file) and prepare data
     """
-    data = pd.read_csv(csv_file, on_bad_lines='skip')
+    if data_path.endswith('.csv'):
+        data = pd.read_csv(data_path, on_bad_lines='skip')
+    else:
+        features, labels = load_features(data_path)
+        print(f"Data sets share {len(features)} OK")
+        return prepare_data(features, labels)
 
     print(f"Data sets share {len(data)} OK")
     print(data.head())
@@ -25,7 +31,12 @@ def load_data(csv_file):
 
     X = data.drop('label', axis=1).values
     y = data['label'].values
+    return prepare_data(X, y)
 
+def prepare_data(X, y):
+    """
+    Encode labels and normalize features
+    """
     # Tag encoding
     label_encoder = LabelEncoder()
     y_encoded = label_encoder.fit_transform(y)
@@ -68,10 +79,10 @@ def save_model(model, model_filename):
         print("Model is empty，Unable to save。")
 
 def main():
-    csv_file = "face_keypoints.csv"
+    data_path = "features/train"  # Feature store path (a .csv keypoint file is accepted as well)
     model_filename = "ml_model/svm_model.pkl"
 
-    X, y, label_encoder, scaler = load_data(csv_file)
+    X, y, label_encoder, scaler = load_data(data_path)
 
     if X is None or y is None:
         print("Data loading failed，Unable to continue。")